@@ -1,7 +1,8 @@
 import os
-import psycopg2
+import psycopg
+from psycopg_pool import ConnectionPool
 from contextlib import contextmanager
-from typing import Iterator, Optional
+from typing import Iterator
 
 DB_URL = os.getenv(
     "DATABASE_URL",
@@ -12,37 +13,77 @@ DB_URL = os.getenv(
 DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
 DB_APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "unap-reco-api")
 
+# psycopg3: tras N ejecuciones la query pasa a prepared server-side
+# (evita re-parsear/planificar el mismo SELECT en cada request)
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "3"))
 
-def get_conn(autocommit: bool = True) -> psycopg2.extensions.connection:
-    """
-    Crea una conexión nueva (psycopg2).
-    - autocommit=True es cómodo para lecturas en API
-    """
-    conn = psycopg2.connect(
-        DB_URL,
-        connect_timeout=DB_CONNECT_TIMEOUT,
-        application_name=DB_APPLICATION_NAME,
+# PGBOUNCER=1 cuando DATABASE_URL apunta a un PgBouncer en pool_mode=transaction
+# (ver PGBOUNCER.md). En ese modo los prepared statements server-side se rompen
+# (cada transacción puede caer en un backend distinto), así que se desactivan,
+# y los keepalives TCP sobran porque la conexión es al bouncer local.
+BEHIND_PGBOUNCER = os.getenv("PGBOUNCER", "0").strip() == "1"
+
+# Pool de conexiones a nivel de proceso: evita el handshake TCP+auth
+# por request y acota el número de backends en Postgres.
+# Detrás de PgBouncer basta un pool chico por worker: el pooling real lo hace él.
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1" if BEHIND_PGBOUNCER else "4"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "3" if BEHIND_PGBOUNCER else "20"))
+
+_conn_kwargs = dict(
+    autocommit=True,
+    connect_timeout=DB_CONNECT_TIMEOUT,
+    application_name=DB_APPLICATION_NAME,
+)
+
+if BEHIND_PGBOUNCER:
+    _conn_kwargs["prepare_threshold"] = None
+else:
+    _conn_kwargs.update(
+        prepare_threshold=DB_PREPARE_THRESHOLD,
         keepalives=1,
         keepalives_idle=30,
         keepalives_interval=10,
         keepalives_count=5,
     )
-    conn.autocommit = autocommit
-    return conn
+
+POOL = ConnectionPool(
+    DB_URL,
+    min_size=DB_POOL_MIN,
+    max_size=DB_POOL_MAX,
+    open=False,  # se abre en el startup de FastAPI
+    kwargs=_conn_kwargs,
+)
+
+
+def open_pool():
+    POOL.open()
+
+
+def close_pool():
+    POOL.close()
+
+
+@contextmanager
+def db_conn() -> Iterator[psycopg.Connection]:
+    """
+    Uso:
+      with db_conn() as conn:
+          with conn.cursor() as cur:
+              cur.execute(...)
+
+    Toma una conexión del pool y la devuelve al salir (no la cierra).
+    """
+    with POOL.connection() as conn:
+        yield conn
 
 
 @contextmanager
-def db_cursor(autocommit: bool = True) -> Iterator[psycopg2.extensions.cursor]:
+def db_cursor() -> Iterator[psycopg.Cursor]:
     """
     Uso:
       with db_cursor() as cur:
           cur.execute(...)
     """
-    conn: Optional[psycopg2.extensions.connection] = None
-    try:
-        conn = get_conn(autocommit=autocommit)
+    with POOL.connection() as conn:
         with conn.cursor() as cur:
             yield cur
-    finally:
-        if conn is not None:
-            conn.close()
\ No newline at end of file
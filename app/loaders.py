@@ -0,0 +1,105 @@
+# app/loaders.py
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from app.db import db_conn
+
+# =========================
+# SQL
+# =========================
+
+SQL_ITEMS_BY_UUIDS = """
+SELECT uuid, title, url, abstract_norm,
+       date_issued, authors, advisors, keywords, university
+FROM items
+WHERE uuid = ANY(%s)
+"""
+
+
+# =========================
+# ITEM LOADER (MICRO-BATCH)
+# =========================
+
+class ItemLoader:
+    """
+    Micro-batcher estilo DataLoader para /items/{uuid}.
+
+    Requests concurrentes dentro de una ventana corta (3 ms por defecto)
+    se fusionan en un solo `WHERE uuid = ANY(%s)` en vez de N SELECTs
+    de una fila: amortiza el round trip y el plan de PG entre requests.
+    """
+
+    def __init__(self, max_batch: int = 64, window_ms: float = 3.0):
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def load(self, uuid: str) -> Optional[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future = loop.create_future()
+        self._pending.setdefault(uuid, []).append(fut)
+
+        if len(self._pending) >= self.max_batch:
+            # batch lleno: no esperar la ventana
+            if self._flush_task is not None:
+                self._flush_task.cancel()
+                self._flush_task = None
+            asyncio.ensure_future(self._flush())
+        elif self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._delayed_flush())
+
+        return await fut
+
+    async def _delayed_flush(self):
+        try:
+            await asyncio.sleep(self.window)
+        except asyncio.CancelledError:
+            return
+        await self._flush()
+
+    async def _flush(self):
+        pending, self._pending = self._pending, {}
+        self._flush_task = None
+        if not pending:
+            return
+
+        uuids = list(pending.keys())
+        try:
+            # db_conn es sync (psycopg3 + pool): fuera del event loop
+            items = await asyncio.to_thread(self._fetch, uuids)
+        except Exception as e:
+            for futs in pending.values():
+                for fut in futs:
+                    if not fut.done():
+                        fut.set_exception(e)
+            return
+
+        for uuid, futs in pending.items():
+            item = items.get(uuid)
+            for fut in futs:
+                if not fut.done():
+                    fut.set_result(item)
+
+    @staticmethod
+    def _fetch(uuids: List[str]) -> Dict[str, Dict[str, Any]]:
+        with db_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(SQL_ITEMS_BY_UUIDS, (uuids,))
+                rows = cur.fetchall()
+
+        return {
+            r[0]: {
+                "uuid": r[0],
+                "title": r[1],
+                "url": r[2],
+                "abstract_norm": r[3],
+                "date_issued": r[4],
+                "authors": r[5],
+                "advisors": r[6],
+                "keywords": r[7],
+                "university": r[8],
+            }
+            for r in rows
+        }
@@ -1,14 +1,34 @@
 # app/main.py
+import hashlib
+import logging
+import os
 import threading
 from typing import List, Optional, Dict, Any
 
+import anyio
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.decorator import cache
 from pydantic import BaseModel
+from redis import asyncio as aioredis
 
-from app.db import get_conn
+from app.db import db_conn, open_pool, close_pool
+from app.loaders import ItemLoader
 from app.recommender import Recommender
 
+REDIS_URL = os.getenv("REDIS_URL", "")
+
+# Threads para el trabajo bloqueante (embedding + FAISS + PG).
+# Acotado: más allá de esto conviene encolar, no apilar threads.
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "8"))
+
+# se crea en startup (necesita event loop)
+worker_limiter: Optional[anyio.CapacityLimiter] = None
+
 # =========================
 # APP
 # =========================
@@ -28,6 +48,7 @@ app.add_middleware(
 # =========================
 
 rec = Recommender()
+item_loader = ItemLoader()
 
 # =========================
 # STARTUP
@@ -35,9 +56,27 @@ rec = Recommender()
 
 @app.on_event("startup")
 def startup():
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
+    global worker_limiter
+    worker_limiter = anyio.CapacityLimiter(WORKER_THREADS)
+
+    open_pool()
+
+    # cache de respuestas: Redis si hay REDIS_URL, memoria local si no
+    if REDIS_URL:
+        FastAPICache.init(RedisBackend(aioredis.from_url(REDIS_URL)), prefix="unap")
+    else:
+        FastAPICache.init(InMemoryBackend(), prefix="unap")
+
     # carga en background (HF-safe)
     threading.Thread(target=rec.load, daemon=True).start()
 
+
+@app.on_event("shutdown")
+def shutdown():
+    close_pool()
+
 # =========================
 # MODELS
 # =========================
@@ -98,7 +137,7 @@ def health():
         "model": rec.model_name,
         "device": rec.device,
         "index_loaded": rec.ready,
-        "index_count": len(rec.uuid_map) if rec.uuid_map else 0,
+        "index_count": int(rec.uuid_map.shape[0]) if rec.uuid_map is not None else 0,
         "error": rec.load_error,
     }
 
@@ -106,99 +145,113 @@ def health():
 # DB HELPERS
 # =========================
 
-def fetch_items_by_uuids(uuids: List[str], model_name: str, include_abstract: bool):
-    conn = get_conn()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                f"""
-                SELECT
-                  i.uuid,
-                  i.title,
-                  i.url,
-                  {"i.abstract_norm," if include_abstract else "NULL::text as abstract_norm,"}
-                  i.university,
-                  c.cluster_id,
-                  cl.label
-                FROM items i
-                LEFT JOIN clusters c
-                  ON c.uuid = i.uuid AND c.model_name = %s
-                LEFT JOIN cluster_labels cl
-                  ON cl.model_name = %s AND cl.cluster_id = c.cluster_id
-                WHERE i.uuid = ANY(%s)
-                """,
-                (model_name, model_name, uuids),
-            )
-            rows = cur.fetchall()
-    finally:
-        conn.close()
-
-    out = {}
-    for r in rows:
-        out[r[0]] = {
-            "uuid": r[0],
-            "title": r[1] or "",
-            "url": r[2],
-            "abstract_norm": r[3] if include_abstract else None,
-            "university": r[4],
-            "cluster_id": r[5],
-            "label": r[6] or "(sin etiqueta)",
-        }
-    return out
+# SQL fijo (sin splicing condicional) para que psycopg3 pueda
+# reutilizar el prepared statement entre requests.
+#
+# Una sola sentencia para todo el path de /recommend: el CTE `top` resuelve
+# el cluster del uuid top-1 y alimenta la rama same-topic; la columna `kind`
+# separa los dos conjuntos al leer. Un solo parse/plan y un solo round trip.
+SQL_RECOMMEND_BUNDLE = """
+WITH top AS (
+  SELECT uuid, model_name, cluster_id
+  FROM clusters
+  WHERE uuid = %s AND model_name = %s AND cluster_id <> -1
+)
+(
+  SELECT 'enrich' AS kind,
+         jsonb_build_object(
+           'uuid', i.uuid,
+           'title', COALESCE(i.title, ''),
+           'url', i.url,
+           'abstract_norm', CASE WHEN %s THEN i.abstract_norm END,
+           'university', i.university,
+           'cluster_id', c.cluster_id,
+           'label', COALESCE(cl.label, '(sin etiqueta)')
+         ) AS payload
+  FROM items i
+  LEFT JOIN clusters c
+    ON c.uuid = i.uuid AND c.model_name = %s
+  LEFT JOIN cluster_labels cl
+    ON cl.model_name = %s AND cl.cluster_id = c.cluster_id
+  WHERE i.uuid = ANY(%s)
+)
+UNION ALL
+(
+  SELECT 'same_topic' AS kind,
+         jsonb_build_object(
+           'uuid', i.uuid,
+           'title', COALESCE(i.title, ''),
+           'url', i.url,
+           'abstract_norm', CASE WHEN %s THEN i.abstract_norm END,
+           'university', i.university,
+           'score', 0.0,
+           'cluster_id', c.cluster_id,
+           'label', COALESCE(cl.label, '(sin etiqueta)')
+         ) AS payload
+  FROM top t
+  JOIN clusters c
+    ON c.model_name = t.model_name AND c.cluster_id = t.cluster_id
+  JOIN items i ON i.uuid = c.uuid
+  LEFT JOIN cluster_labels cl
+    ON cl.model_name = t.model_name AND cl.cluster_id = t.cluster_id
+  WHERE i.uuid <> t.uuid
+  ORDER BY i.updated_at DESC
+  LIMIT %s
+)
+"""
 
 
-def fetch_same_topic_items(
+def fetch_recommend_bundle(
+    uuids: List[str],
+    top1_uuid: Optional[str],
     model_name: str,
-    cluster_id: int,
-    exclude_uuid: str,
-    limit: int,
+    same_topic_k: int,
     include_abstract: bool,
+    want_same_topic: bool,
 ):
-    conn = get_conn()
-    try:
+    """
+    Ejecuta enrichment + same-topic como una sola query (CTE + UNION ALL):
+    un round trip y un prepared statement para todo /recommend.
+    """
+    # LIMIT 0 apaga la rama same-topic sin cambiar el texto SQL
+    same_limit = same_topic_k if (want_same_topic and top1_uuid) else 0
+
+    with db_conn() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                f"""
-                SELECT i.uuid, i.title, i.url,
-                       {"i.abstract_norm," if include_abstract else "NULL::text as abstract_norm,"}
-                       i.university,
-                       c.cluster_id, cl.label
-                FROM clusters c
-                JOIN items i ON i.uuid = c.uuid
-                LEFT JOIN cluster_labels cl
-                  ON cl.model_name = %s AND cl.cluster_id = c.cluster_id
-                WHERE c.model_name = %s
-                  AND c.cluster_id = %s
-                  AND i.uuid <> %s
-                ORDER BY i.updated_at DESC
-                LIMIT %s
-                """,
-                (model_name, model_name, cluster_id, exclude_uuid, limit),
+                SQL_RECOMMEND_BUNDLE,
+                (
+                    top1_uuid,
+                    model_name,
+                    include_abstract,
+                    model_name,
+                    model_name,
+                    uuids,
+                    include_abstract,
+                    same_limit,
+                ),
             )
             rows = cur.fetchall()
-    finally:
-        conn.close()
-
-    return [
-        {
-            "uuid": r[0],
-            "title": r[1] or "",
-            "url": r[2],
-            "abstract_norm": r[3] if include_abstract else None,
-            "university": r[4],
-            "score": 0.0,
-            "cluster_id": r[5],
-            "label": r[6] or "(sin etiqueta)",
-        }
-        for r in rows
-    ]
+
+    # el payload ya viene armado como jsonb desde PG (psycopg3 lo decodifica
+    # a dict): aquí solo se particiona por kind
+    enriched = {r[1]["uuid"]: r[1] for r in rows if r[0] == "enrich"}
+    same_topic = [r[1] for r in rows if r[0] == "same_topic"]
+
+    return enriched, same_topic
 
 # =========================
 # RECOMMEND
 # =========================
 
+def recommend_cache_key(req: "RecommendRequest") -> str:
+    # clave estable por payload (no hay datos por-usuario en el request)
+    digest = hashlib.sha1(req.model_dump_json().encode("utf-8")).hexdigest()
+    return f"{FastAPICache.get_prefix()}:recommend:{digest}"
+
+
 @app.post("/recommend", response_model=RecommendResponse)
-def recommend(req: RecommendRequest):
+async def recommend(req: RecommendRequest):
     if not rec.ready:
         raise HTTPException(503, rec.load_error or "Modelo cargando")
 
@@ -206,33 +259,75 @@ def recommend(req: RecommendRequest):
     if not q:
         raise HTTPException(400, "text vacío")
 
+    # El decorador @cache de fastapi-cache ignora todo lo que no sea GET,
+    # así que el cache de respuesta del POST va a mano contra el mismo
+    # backend (Redis o memoria), con la misma expiración de 60 s
+    key = recommend_cache_key(req)
+    backend = FastAPICache.get_backend()
+    coder = FastAPICache.get_coder()
+    try:
+        cached = await backend.get(key)
+    except Exception:
+        cached = None
+    if cached is not None:
+        return coder.decode(cached)
+
+    # embedding + FAISS + PG son bloqueantes: al threadpool acotado
+    response = await anyio.to_thread.run_sync(
+        _recommend_sync, req, q, limiter=worker_limiter
+    )
+
+    try:
+        await backend.set(key, coder.encode(response), 60)
+    except Exception:
+        pass  # cache caído no debe tirar la respuesta
+
+    return response
+
+
+def _recommend_sync(req: RecommendRequest, q: str):
     model_name = rec.model_name
 
-    pairs = rec.search(q, k=req.k)
+    # cache semántico: paráfrasis de queries ya respondidas no pagan DB
+    qvec = rec.encode_query(q)
+    params_key = f"{req.k}:{req.include_abstract}:{req.same_topic}:{req.same_topic_k}"
+
+    cached = rec.qcache_get(qvec, params_key)
+    if cached is not None:
+        return cached
+
+    pairs = rec.search_vec(qvec, k=req.k)
     uuids = [u for u, _ in pairs]
 
-    enriched = fetch_items_by_uuids(
-        uuids, model_name, include_abstract=req.include_abstract
+    enriched, same_topic_rows = fetch_recommend_bundle(
+        uuids,
+        uuids[0] if uuids else None,
+        model_name,
+        req.same_topic_k,
+        include_abstract=req.include_abstract,
+        want_same_topic=req.same_topic,
     )
 
+    # los payloads ya vienen armados desde PG (chunk jsonb): aquí solo se
+    # inyecta el score; una mutación de dict por fila en vez de reconstruirlo
+    _missing = {
+        "title": "",
+        "url": None,
+        "abstract_norm": None,
+        "university": None,
+        "cluster_id": None,
+        "label": "(sin etiqueta)",
+    }
+
     results = []
-    top1 = None
-
-    for i, (uuid, score) in enumerate(pairs):
-        it = enriched.get(uuid, {})
-        row = {
-            "uuid": uuid,
-            "title": it.get("title", ""),
-            "url": it.get("url"),
-            "abstract_norm": it.get("abstract_norm"),
-            "university": it.get("university"),
-            "score": float(score),
-            "cluster_id": it.get("cluster_id"),
-            "label": it.get("label") or "(sin etiqueta)",
-        }
+    for uuid, score in pairs:
+        row = enriched.get(uuid)
+        if row is None:
+            row = dict(_missing, uuid=uuid)
+        row["score"] = float(score)
         results.append(row)
-        if i == 0:
-            top1 = row
+
+    top1 = results[0] if results else None
 
     inferred_topic = None
     same_topic = None
@@ -244,15 +339,9 @@ def recommend(req: RecommendRequest):
         }
 
         if req.same_topic:
-            same_topic = fetch_same_topic_items(
-                model_name,
-                inferred_topic["cluster_id"],
-                top1["uuid"],
-                req.same_topic_k,
-                include_abstract=req.include_abstract,
-            )
+            same_topic = same_topic_rows
 
-    return {
+    response = {
         "model_name": model_name,
         "k": req.k,
         "inferred_topic": inferred_topic,
@@ -260,39 +349,111 @@ def recommend(req: RecommendRequest):
         "same_topic": same_topic,
     }
 
+    rec.qcache_put(qvec, params_key, response)
+    return response
+
 # =========================
-# EXTRA ENDPOINTS (SIN CAMBIOS)
+# TOPICS
 # =========================
 
-@app.get("/items/{uuid}")
-def get_item(uuid: str):
-    conn = get_conn()
-    try:
+@app.get("/topics/top")
+@cache(expire=600)
+async def topics_top(limit: int = 20):
+    return await anyio.to_thread.run_sync(_topics_top_sync, limit, limiter=worker_limiter)
+
+
+# PG arma el array JSON completo: una fila, cero loops en Python
+SQL_TOPICS_TOP = """
+SELECT COALESCE(jsonb_agg(t ORDER BY t.count DESC), '[]'::jsonb)
+FROM (
+  SELECT c.cluster_id,
+         COALESCE(cl.label, '(sin etiqueta)') AS label,
+         COUNT(*) AS count
+  FROM clusters c
+  LEFT JOIN cluster_labels cl
+    ON cl.model_name = c.model_name AND cl.cluster_id = c.cluster_id
+  WHERE c.model_name = %s
+    AND c.cluster_id <> -1
+  GROUP BY c.cluster_id, cl.label
+  ORDER BY count DESC
+  LIMIT %s
+) t
+"""
+
+SQL_TOPICS_CLUSTER = """
+SELECT (SELECT label
+        FROM cluster_labels
+        WHERE model_name = %s AND cluster_id = %s),
+       COALESCE(jsonb_agg(
+         jsonb_build_object(
+           'uuid', t.uuid,
+           'title', t.title,
+           'url', t.url,
+           'university', t.university
+         ) ORDER BY t.updated_at DESC
+       ), '[]'::jsonb)
+FROM (
+  SELECT i.uuid, i.title, i.url, i.university, i.updated_at
+  FROM clusters c
+  JOIN items i ON i.uuid = c.uuid
+  WHERE c.model_name = %s
+    AND c.cluster_id = %s
+  ORDER BY i.updated_at DESC
+  LIMIT %s
+) t
+"""
+
+
+def _topics_top_sync(limit: int):
+    with db_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SQL_TOPICS_TOP, (rec.model_name, limit))
+            topics = cur.fetchone()[0]
+
+    return {
+        "model_name": rec.model_name,
+        "topics": topics,
+    }
+
+
+@app.get("/topics/{cluster_id}")
+@cache(expire=300)
+async def topics_cluster(cluster_id: int, limit: int = 50):
+    return await anyio.to_thread.run_sync(
+        _topics_cluster_sync, cluster_id, limit, limiter=worker_limiter
+    )
+
+
+def _topics_cluster_sync(cluster_id: int, limit: int):
+    with db_conn() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                """
-                SELECT uuid, title, url, abstract_norm,
-                       date_issued, authors, advisors, keywords, university
-                FROM items
-                WHERE uuid = %s
-                """,
-                (uuid,),
+                SQL_TOPICS_CLUSTER,
+                (rec.model_name, cluster_id, rec.model_name, cluster_id, limit),
             )
-            r = cur.fetchone()
-    finally:
-        conn.close()
+            row = cur.fetchone()
 
-    if not r:
-        raise HTTPException(404, "uuid no encontrado")
+    items = row[1] if row else []
+    if not items:
+        raise HTTPException(404, "cluster_id sin items")
 
     return {
-        "uuid": r[0],
-        "title": r[1],
-        "url": r[2],
-        "abstract_norm": r[3],
-        "date_issued": r[4],
-        "authors": r[5],
-        "advisors": r[6],
-        "keywords": r[7],
-        "university": r[8],
+        "cluster_id": cluster_id,
+        "label": (row[0] if row else None) or "(sin etiqueta)",
+        "items": items,
     }
+
+# =========================
+# EXTRA ENDPOINTS (SIN CAMBIOS)
+# =========================
+
+@app.get("/items/{uuid}")
+@cache(expire=3600)
+async def get_item(uuid: str):
+    # lookups concurrentes se fusionan en un solo SELECT (ver app/loaders.py)
+    item = await item_loader.load(uuid)
+
+    if not item:
+        raise HTTPException(404, "uuid no encontrado")
+
+    return item
@@ -1,11 +1,20 @@
 #app/pipeline.py
 import os
 import subprocess
+import threading
 from typing import Optional, Dict, Any, List
 
 PY = os.getenv("PYTHON_BIN", "python")
 
 
+def _tail_reader(stream, out: Dict[str, str], key: str, tail: int):
+    """Consume el stream en chunks manteniendo solo los últimos `tail` chars"""
+    buf = ""
+    for chunk in iter(lambda: stream.read(8192), ""):
+        buf = (buf + chunk)[-tail:]
+    out[key] = buf
+
+
 def run_script(
     path: str,
     args: Optional[List[str]] = None,
@@ -20,34 +29,53 @@ def run_script(
     - timeout: evita procesos colgados
     - cwd: útil si tu script depende de rutas relativas
     - env: variables extra
+
+    La salida se consume en streaming con buffer acotado a `tail` chars por
+    stream: un script que imprime megabytes no infla la RAM del proceso API.
     """
     cmd = [PY, path] + (args or [])
     merged_env = os.environ.copy()
     if env:
         merged_env.update(env)
 
+    p = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        cwd=cwd,
+        env=merged_env,
+    )
+
+    out = {"stdout": "", "stderr": ""}
+    readers = [
+        threading.Thread(target=_tail_reader, args=(p.stdout, out, "stdout", tail)),
+        threading.Thread(target=_tail_reader, args=(p.stderr, out, "stderr", tail)),
+    ]
+    for t in readers:
+        t.start()
+
     try:
-        p = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            cwd=cwd,
-            env=merged_env,
-            timeout=timeout,
-        )
-        stdout = (p.stdout or "")
-        stderr = (p.stderr or "")
-        return {
-            "cmd": cmd,
-            "returncode": p.returncode,
-            "stdout": stdout[-tail:],
-            "stderr": stderr[-tail:],
-        }
-    except subprocess.TimeoutExpired as e:
+        returncode = p.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        p.kill()
+        p.wait()
+        for t in readers:
+            t.join()
         return {
             "cmd": cmd,
             "returncode": 124,
-            "stdout": (e.stdout or "")[-tail:] if hasattr(e, "stdout") else "",
-            "stderr": (e.stderr or "")[-tail:] if hasattr(e, "stderr") else "",
+            "stdout": out["stdout"],
+            "stderr": out["stderr"],
             "error": f"timeout_exceeded ({timeout}s)"
         }
+
+    for t in readers:
+        t.join()
+
+    return {
+        "cmd": cmd,
+        "returncode": returncode,
+        "stdout": out["stdout"],
+        "stderr": out["stderr"],
+    }
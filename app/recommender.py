@@ -1,7 +1,10 @@
 # app/recommender.py
 import os
 import json
+import logging
+import queue
 import threading
+import time
 from typing import List, Tuple, Optional
 
 import numpy as np
@@ -9,9 +12,34 @@ import faiss
 import torch
 from sentence_transformers import SentenceTransformer
 
+# Permite pasar tensores torch (incluso en GPU) directo a index.search,
+# sin round trip por host ni conversión a numpy
+try:
+    import faiss.contrib.torch_utils  # noqa: F401
+    HAVE_FAISS_TORCH = True
+except Exception:
+    HAVE_FAISS_TORCH = False
+
 # Evita warnings y locks en HF
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+# En CPU, torch arranca con un threading conservador: usar los cores
+# disponibles (cap a 8: más allá el GEMM de queries cortas no escala).
+# Debe ejecutarse antes de cualquier trabajo paralelo de torch.
+if not torch.cuda.is_available():
+    _n_threads = int(os.getenv("TORCH_THREADS", str(min(os.cpu_count() or 1, 8))))
+    try:
+        torch.set_num_threads(_n_threads)
+        torch.set_num_interop_threads(2)
+    except Exception:
+        pass
+    try:
+        faiss.omp_set_num_threads(_n_threads)
+    except Exception:
+        pass
+
+logger = logging.getLogger(__name__)
+
 # =========================
 # CONFIG
 # =========================
@@ -19,6 +47,18 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 MODEL_DIR = os.getenv("MODEL_DIR", "models_semantic")
 DEFAULT_MODEL_NAME = os.getenv("MODEL_NAME", "BAAI/bge-m3")
 
+# Cache semántico de queries: si una query nueva tiene coseno >= umbral
+# contra una ya respondida, se devuelve la respuesta cacheada
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+SEMANTIC_CACHE_MAX = int(os.getenv("SEMANTIC_CACHE_MAX", "2000"))
+# Mismo horizonte que el cache exacto de respuestas (60 s): una entrada
+# más vieja se considera vencida aunque el coseno matchee
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "60"))
+
+# search_batch: por encima de este tamaño se trocea y se solapa
+# encode (thread productor) con index.search (consumidor)
+SEARCH_PIPELINE_BATCH = int(os.getenv("SEARCH_PIPELINE_BATCH", "64"))
+
 
 # =========================
 # DEVICE SELECTION
@@ -64,6 +104,36 @@ def can_use_faiss_gpu() -> bool:
     return torch.cuda.is_available() and hasattr(faiss, "StandardGpuResources")
 
 
+# =========================
+# ONNX INT8 ENCODER (CPU)
+# =========================
+
+class ORTEncoder:
+    """
+    Wrapper mínimo compatible con SentenceTransformer.encode() para el
+    encoder ONNX int8. bge usa pooling CLS + normalización L2.
+    """
+
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+
+    def encode(self, texts, **kwargs):
+        enc = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=512,
+            return_tensors="pt",
+        )
+        with torch.inference_mode():
+            out = self.model(**enc)
+
+        emb = out.last_hidden_state[:, 0]  # CLS
+        emb = torch.nn.functional.normalize(emb, p=2, dim=1)
+        return emb.cpu().numpy()
+
+
 # =========================
 # RECOMMENDER
 # =========================
@@ -71,8 +141,9 @@ def can_use_faiss_gpu() -> bool:
 class Recommender:
     def __init__(self):
         self.index = None
-        self.uuid_map: Optional[List[str]] = None
-        self.model: Optional[SentenceTransformer] = None
+        self.uuid_map: Optional[np.ndarray] = None  # bytes |S36
+        # SentenceTransformer u ORTEncoder (misma interfaz .encode)
+        self.model = None
 
         self.device = choose_device()
         self._lock = threading.RLock()
@@ -83,6 +154,18 @@ class Recommender:
         # Estado
         self.ready: bool = False
         self.load_error: Optional[str] = None
+        # Solo True si el warmup detecta un encoder que no normaliza L2
+        self._renormalize: bool = False
+
+        # Snapshot inmutable (index, uuid_map) publicado por load/reload:
+        # los paths de búsqueda lo leen sin tomar _lock (la asignación de
+        # un atributo es atómica en CPython) y siempre ven un par coherente
+        self._live: Optional[Tuple] = None
+
+        # Cache semántico (índice de queries ya respondidas);
+        # entradas (params_key, response, timestamp monotónico)
+        self.qcache_index = None
+        self.qcache_entries: List[Tuple[str, dict, float]] = []
 
     # =========================
     # LOAD FAISS (HF SAFE)
@@ -98,25 +181,182 @@ class Recommender:
         if not os.path.exists(map_path):
             raise RuntimeError(f"uuid_map.json not found: {map_path}")
         
-        # Verificar que no sea un puntero LFS
+        # Verificar que no sea un puntero LFS (lectura binaria: un índice
+        # faiss real no es UTF-8 válido)
         index_size = os.path.getsize(index_path)
         if index_size < 1000:  # Si es muy pequeño, probablemente es un puntero LFS
-            with open(index_path, 'r') as f:
-                content = f.read()
-                if 'version https://git-lfs.github.com' in content:
-                    raise RuntimeError(f"FAISS index is a Git LFS pointer, not the actual file. Size: {index_size} bytes. HF Spaces needs to pull LFS files.")
-        
-        print(f"  📊 Loading FAISS index ({index_size / 1024 / 1024:.1f} MB)...")
+            with open(index_path, "rb") as f:
+                head = f.read(200)
+            if head.startswith(b"version https://"):
+                raise RuntimeError(f"FAISS index is a Git LFS pointer, not the actual file. Size: {index_size} bytes. HF Spaces needs to pull LFS files.")
+
+        logger.info("Loading FAISS index (%.1f MB)...", index_size / 1024 / 1024)
+
+        # mmap: el OS pagina solo lo que toca la búsqueda (menos RSS, cold
+        # start más rápido, páginas compartidas entre workers). No todos los
+        # formatos on-disk lo soportan → fallback a lectura completa.
+        try:
+            index = faiss.read_index(
+                index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            )
+        except Exception:
+            index = faiss.read_index(index_path)
+
+        # Índices aproximados (scripts/02 con FAISS_INDEX_KIND=opq_ivfpq o
+        # scripts/04.convert_faiss_index.py): ajustar parámetros de búsqueda.
+        # extract_index_ivf también encuentra el IVF dentro de un
+        # IndexPreTransform (p.ej. OPQ64,IVF*,PQ64 del index_factory).
+        try:
+            faiss.extract_index_ivf(index).nprobe = int(os.getenv("FAISS_NPROBE", "16"))
+        except Exception:
+            if isinstance(index, faiss.IndexHNSWFlat):
+                index.hnsw.efSearch = int(os.getenv("FAISS_EF_SEARCH", "64"))
 
-        index = faiss.read_index(index_path)
+        uuid_map = self._load_uuid_map(map_path)
+
+        return index, uuid_map
+
+    @staticmethod
+    def _apply_uuid_log(arr: np.ndarray, log_path: str) -> np.ndarray:
+        """Aplica el log append-only de scripts/02 (entradas post-compactación)"""
+        if not os.path.exists(log_path):
+            return arr
+        base = int(arr.shape[0])
+        entries = []
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                idx, _, uid = line.rstrip("\n").partition("\t")
+                try:
+                    i = int(idx)
+                except ValueError:
+                    continue
+                if i >= base:
+                    entries.append((i, uid))
+        if not entries:
+            return arr
+        entries.sort()
+        extra = np.asarray([u for _, u in entries], dtype="|S36")
+        return np.concatenate([np.asarray(arr), extra])
+
+    @staticmethod
+    def _load_uuid_map(map_path: str) -> np.ndarray:
+        """
+        Devuelve el uuid_map como array numpy de bytes fijos (|S36):
+        ~10x menos heap que una lista de str y mejor localidad en search.
+        El array se persiste como .npy para saltarse el parseo JSON en el
+        siguiente arranque.
+        """
+        npy_path = os.path.splitext(map_path)[0] + ".npy"
+        log_path = os.path.splitext(map_path)[0] + ".log"
+
+        if (
+            os.path.exists(npy_path)
+            and os.path.getmtime(npy_path) >= os.path.getmtime(map_path)
+        ):
+            # mmap: el array no se copia al heap, el OS pagina bajo demanda
+            return Recommender._apply_uuid_log(
+                np.load(npy_path, mmap_mode="r"), log_path
+            )
 
         with open(map_path, "r", encoding="utf-8") as f:
-            uuid_map = json.load(f)
+            raw = json.load(f)
+
+        # scripts/02 escribe un dict {posición: uuid}; aceptar también lista
+        if isinstance(raw, dict):
+            raw = [raw[str(i)] for i in range(len(raw))]
 
-        if not isinstance(uuid_map, list) or not uuid_map:
+        if not isinstance(raw, list) or not raw:
             raise RuntimeError("uuid_map.json inválido o vacío")
 
-        return index, uuid_map
+        uuid_map = Recommender._apply_uuid_log(
+            np.asarray(raw, dtype="|S36"), log_path
+        )
+
+        try:
+            np.save(npy_path, uuid_map)
+        except OSError:
+            pass  # filesystem read-only (HF Spaces): se reconvierte cada boot
+
+        return uuid_map
+
+    # =========================
+    # LOAD ENCODER
+    # =========================
+
+    def _load_onnx_int8_encoder(self) -> Optional[ORTEncoder]:
+        """
+        Exporta el encoder a ONNX y lo cuantiza a int8 dinámico (AVX-512 VNNI)
+        la primera vez; luego reutiliza el artefacto en MODEL_DIR/onnx-int8/.
+        Opt-in con ONNX_INT8=1 (requiere optimum[onnxruntime], solo CPU).
+        """
+        try:
+            from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+            from transformers import AutoTokenizer
+        except ImportError:
+            logger.warning("ONNX_INT8=1 pero optimum[onnxruntime] no está instalado. Usando PyTorch.")
+            return None
+
+        onnx_dir = os.path.join(MODEL_DIR, "onnx-int8")
+
+        try:
+            if not os.path.exists(os.path.join(onnx_dir, "model_quantized.onnx")):
+                logger.info("Exportando encoder a ONNX + cuantización int8 (solo la primera vez)...")
+                model = ORTModelForFeatureExtraction.from_pretrained(self.model_name, export=True)
+                model.save_pretrained(onnx_dir)
+
+                quantizer = ORTQuantizer.from_pretrained(onnx_dir)
+                quantizer.quantize(
+                    save_dir=onnx_dir,
+                    quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False),
+                )
+
+            ort_model = ORTModelForFeatureExtraction.from_pretrained(
+                onnx_dir, file_name="model_quantized.onnx"
+            )
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            logger.info("Encoder ONNX int8 cargado")
+            return ORTEncoder(ort_model, tokenizer)
+        except Exception as e:
+            logger.warning("Carga ONNX int8 falló, usando PyTorch: %s", e)
+            return None
+
+    def _load_encoder(self):
+        if self.device == "cpu" and os.getenv("ONNX_INT8", "0").strip() == "1":
+            encoder = self._load_onnx_int8_encoder()
+            if encoder is not None:
+                return encoder
+
+        model = SentenceTransformer(self.model_name, device=self.device)
+
+        # Solo inferencia: sin bookkeeping de autograd
+        model.eval()
+        for p in model.parameters():
+            p.requires_grad_(False)
+
+        if self.device == "cuda":
+            # fp16 duplica throughput; bf16 no sirve aquí porque encode()
+            # baja los embeddings a numpy y numpy no tiene dtype bfloat16
+            try:
+                model.half()
+            except Exception:
+                pass
+
+            try:
+                from optimum.bettertransformer import BetterTransformer
+                model[0].auto_model = BetterTransformer.transform(model[0].auto_model)
+            except Exception:
+                pass
+
+            # fusiona kernels para el batch [1, seq_len] de /recommend
+            try:
+                model[0].auto_model = torch.compile(
+                    model[0].auto_model, mode="reduce-overhead", fullgraph=False
+                )
+            except Exception:
+                pass
+
+        return model
 
     def _maybe_to_gpu(self, index):
         if not self.use_faiss_gpu:
@@ -126,7 +366,19 @@ class Recommender:
 
         try:
             res = faiss.StandardGpuResources()
-            return faiss.index_cpu_to_gpu(res, 0, index)
+
+            # fp16 en device: mitad de ancho de banda, y el coarse quantizer
+            # de un IVF puede usar Tensor Cores (cublasHgemm)
+            co = faiss.GpuClonerOptions()
+            co.useFloat16 = True
+            try:
+                faiss.extract_index_ivf(index)
+                co.useFloat16CoarseQuantizer = True
+                co.usePrecomputed = True
+            except Exception:
+                pass
+
+            return faiss.index_cpu_to_gpu(res, 0, index, co)
         except Exception:
             return index
 
@@ -144,33 +396,50 @@ class Recommender:
                 index, uuid_map = self._load_index_and_map_cpu()
 
                 # 2. Cargar modelo de embeddings
-                model = SentenceTransformer(self.model_name, device=self.device)
-
-                if self.device == "cuda":
-                    try:
-                        model.half()
-                    except Exception:
-                        pass
+                # (ONNX int8 en CPU si ONNX_INT8=1, bf16+BetterTransformer en CUDA)
+                model = self._load_encoder()
 
                 # 3. FAISS a GPU (opcional)
                 index = self._maybe_to_gpu(index)
 
-                # 4. Asignar estado
+                # 4. Asignar componentes (ready todavía no: primero tiene
+                # que pasar el warmup)
                 self.index = index
                 self.uuid_map = uuid_map
                 self.model = model
+
+                # 5. Warmup: el primer encode paga tokenizer, kernels y
+                # (en CUDA) la compilación de torch.compile; el segundo
+                # estabiliza (autotune / graph capture ya cacheados).
+                # Si el encoder no puede producir un vector, el servicio
+                # tampoco va a poder: se deja propagar al except de abajo
+                # en vez de publicar un ready que 500ea en cada request
+                vec = self._qvec_numpy(self._encode_query("warmup"))
+                # Sanity check una sola vez: si el encoder no normaliza
+                # (p.ej. un wrapper exótico), re-normalizamos por query
+                norm = float(np.linalg.norm(vec[0]))
+                self._renormalize = abs(norm - 1.0) > 1e-3
+                if self._renormalize:
+                    logger.warning(
+                        "Encoder no normaliza L2 (|v|=%.4f): se re-normalizará por query", norm
+                    )
+                self._encode_query("warmup")
+
+                # 6. Publicar snapshot y ready (el par index/uuid_map ya
+                # es coherente y el encoder está verificado)
+                self._live = (index, uuid_map)
                 self.ready = True
                 self.load_error = None
 
-                print("✅ Recommender READY")
-                print(f"   - Model: {self.model_name}")
-                print(f"   - Device: {self.device}")
-                print(f"   - Vectors: {len(self.uuid_map)}")
+                logger.info(
+                    "Recommender READY (model=%s, device=%s, vectors=%d)",
+                    self.model_name, self.device, len(self.uuid_map),
+                )
 
             except Exception as e:
                 self.ready = False
                 self.load_error = str(e)
-                print("❌ Recommender load failed:", e)
+                logger.error("Recommender load failed: %s", e)
 
     # =========================
     # HOT RELOAD (OPTIONAL)
@@ -182,46 +451,202 @@ class Recommender:
             index = self._maybe_to_gpu(index)
             self.index = index
             self.uuid_map = uuid_map
+            self._live = (index, uuid_map)
+
+            # Las respuestas cacheadas referencian el índice anterior:
+            # sin esto, queries parecidas seguirían sirviendo resultados
+            # pre-rebuild hasta que el cache rote por tamaño
+            if self.qcache_index is not None:
+                self.qcache_index.reset()
+            self.qcache_entries.clear()
 
     # =========================
     # SEARCH
     # =========================
 
-    def _encode_query(self, query: str) -> np.ndarray:
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Codifica N queries en un solo encode (SGEMM amortizado) -> (N, d)"""
         if not self.model:
             raise RuntimeError("Modelo no cargado")
 
-        q = (query or "").strip()
-        if not q:
+        qs = [(q or "").strip() for q in queries]
+        if not qs or any(not q for q in qs):
             raise ValueError("query vacío")
 
-        vec = self.model.encode(
-            [q],
-            convert_to_numpy=True,
-            normalize_embeddings=True,
-            show_progress_bar=False,
-        ).astype(np.float32)
+        # Path tensor end-to-end: con índice GPU el tensor se queda en
+        # device, sin round trip por host ni conversión a numpy. Tiene que
+        # ser float32 contiguo: el wrapper torch de faiss lo asserta
+        if self.device == "cuda" and self.use_faiss_gpu and HAVE_FAISS_TORCH:
+            with torch.inference_mode():
+                vecs = self.model.encode(
+                    qs,
+                    convert_to_tensor=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False,
+                    batch_size=64,
+                )
+            return vecs.float().contiguous()
+
+        with torch.inference_mode():
+            vecs = self.model.encode(
+                qs,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+                batch_size=64,
+            )
+
+        # encode ya normaliza L2; solo garantizar float32 contiguo sin copiar
+        vecs = np.ascontiguousarray(vecs.astype(np.float32, copy=False))
+        if self._renormalize:
+            faiss.normalize_L2(vecs)
+        return vecs
+
+    def _encode_query(self, query: str) -> np.ndarray:
+        return self._encode_queries([query])
 
-        faiss.normalize_L2(vec)
-        return vec
+    def encode_query(self, query: str) -> np.ndarray:
+        # Sin lock: tras load(), modelo e índice son inmutables hasta un
+        # reload, que publica el snapshot nuevo con una sola asignación
+        if not self.ready:
+            raise RuntimeError(f"Recommender not ready: {self.load_error}")
+        return self._encode_query(query)
 
     def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
-        with self._lock:
-            if not self.ready:
-                raise RuntimeError(f"Recommender not ready: {self.load_error}")
+        return self.search_vec(self.encode_query(query), k=k)
+
+    def search_batch(self, queries: List[str], k: int = 10) -> List[List[Tuple[str, float]]]:
+        """
+        Busca N queries de una vez: un solo encode y un solo index.search
+        sobre la matriz (N, d) en vez de N llamadas con batch=1.
+        Para lotes grandes, encola el encode en un thread productor para
+        solapar el encoder con las búsquedas FAISS.
+        """
+        live = self._live
+        if not self.ready or live is None:
+            raise RuntimeError(f"Recommender not ready: {self.load_error}")
+        index, umap = live
+
+        if len(queries) > SEARCH_PIPELINE_BATCH:
+            return self._search_batch_pipelined(queries, k, index, umap)
+
+        qmat = self._encode_queries(queries)
+        D, I = index.search(qmat, int(k))
+
+        return [
+            self._rows_to_results(I[i].tolist(), D[i].tolist(), umap)
+            for i in range(len(queries))
+        ]
+
+    def _search_batch_pipelined(self, queries: List[str], k: int, index, umap) -> List[List[Tuple[str, float]]]:
+        """
+        Solapa el encode del lote i+1 con el index.search del lote i:
+        un thread productor codifica sub-lotes hacia una cola acotada
+        mientras este thread los busca en el índice.
+        """
+        # Ordenar por longitud antes de trocear: cada sub-lote queda
+        # homogéneo y el padding al más largo del lote se minimiza
+        # (longitud en caracteres como proxy barato del nº de tokens)
+        order = sorted(range(len(queries)), key=lambda i: len(queries[i]))
+        sorted_queries = [queries[i] for i in order]
+
+        chunks_q: "queue.Queue" = queue.Queue(maxsize=2)
+
+        def producer():
+            try:
+                for i in range(0, len(sorted_queries), SEARCH_PIPELINE_BATCH):
+                    chunk = sorted_queries[i:i + SEARCH_PIPELINE_BATCH]
+                    chunks_q.put(("ok", self._encode_queries(chunk)))
+                chunks_q.put(("done", None))
+            except Exception as e:
+                chunks_q.put(("err", e))
+
+        t = threading.Thread(target=producer, daemon=True)
+        t.start()
+
+        results: List[List[Tuple[str, float]]] = []
+        while True:
+            kind, payload = chunks_q.get()
+            if kind == "done":
+                break
+            if kind == "err":
+                raise payload
+            D, I = index.search(payload, int(k))
+            for i in range(payload.shape[0]):
+                results.append(self._rows_to_results(I[i].tolist(), D[i].tolist(), umap))
+
+        t.join()
+
+        # Deshacer la permutación: resultados en el orden original
+        out: List[List[Tuple[str, float]]] = [[] for _ in queries]
+        for pos, res in zip(order, results):
+            out[pos] = res
+        return out
+
+    def search_vec(self, qvec, k: int = 10) -> List[Tuple[str, float]]:
+        # qvec: np.ndarray, o torch.Tensor en device en el path GPU
+        live = self._live
+        if not self.ready or live is None:
+            raise RuntimeError(f"Recommender not ready: {self.load_error}")
+        index, umap = live
+
+        D, I = index.search(qvec, int(k))
+        return self._rows_to_results(I[0].tolist(), D[0].tolist(), umap)
+
+    @staticmethod
+    def _rows_to_results(idxs, sims, umap) -> List[Tuple[str, float]]:
+        # umap viene del snapshot del caller: coherente con el índice usado
+        n = umap.shape[0]
+        return [
+            (umap[pos].decode(), float(score))
+            for pos, score in zip(idxs, sims)
+            if 0 <= pos < n
+        ]
 
-            qvec = self._encode_query(query)
+    # =========================
+    # SEMANTIC QUERY CACHE
+    # =========================
 
-            D, I = self.index.search(qvec, int(k))
-            idxs = I[0].tolist()
-            sims = D[0].tolist()
+    @staticmethod
+    def _qvec_numpy(qvec) -> np.ndarray:
+        """El qcache vive en CPU: bajar el tensor de device a float32 numpy"""
+        if isinstance(qvec, torch.Tensor):
+            return np.ascontiguousarray(qvec.detach().float().cpu().numpy())
+        return qvec
+
+    def qcache_get(self, qvec, params_key: str) -> Optional[dict]:
+        """
+        Busca una query pasada "casi igual" (coseno >= umbral) con los mismos
+        parámetros de request; si existe, devuelve su respuesta cacheada.
+        """
+        qvec = self._qvec_numpy(qvec)
+        with self._lock:
+            if self.qcache_index is None or self.qcache_index.ntotal == 0:
+                return None
+
+            D, I = self.qcache_index.search(qvec, 1)
+            pos = int(I[0][0])
+            if pos < 0 or float(D[0][0]) < SEMANTIC_CACHE_THRESHOLD:
+                return None
+
+            cached_key, response, ts = self.qcache_entries[pos]
+            if cached_key != params_key:
+                return None
+            if time.monotonic() - ts > SEMANTIC_CACHE_TTL:
+                return None
+            return response
+
+    def qcache_put(self, qvec, params_key: str, response: dict):
+        qvec = self._qvec_numpy(qvec)
+        with self._lock:
+            if self.qcache_index is None:
+                self.qcache_index = faiss.IndexFlatIP(qvec.shape[1])
 
-            results: List[Tuple[str, float]] = []
-            for pos, score in zip(idxs, sims):
-                if pos == -1:
-                    continue
-                if pos < 0 or pos >= len(self.uuid_map):
-                    continue
-                results.append((self.uuid_map[pos], float(score)))
+            # IndexFlatIP no soporta remove barato: al llenarse se vacía
+            # entero (el cache se repuebla solo con el tráfico)
+            if len(self.qcache_entries) >= SEMANTIC_CACHE_MAX:
+                self.qcache_index.reset()
+                self.qcache_entries.clear()
 
-            return results
+            self.qcache_index.add(qvec)
+            self.qcache_entries.append((params_key, response, time.monotonic()))
@@ -0,0 +1,34 @@
+-- Indexes for the hot API queries (run once, then verify with EXPLAIN)
+--
+--   psql "$DATABASE_URL" -f migrations/001_indexes.sql
+--
+-- Covered queries:
+--   * /recommend enrichment:   items.uuid = ANY(...)
+--   * /recommend same-topic:   clusters(model_name, cluster_id) -> items ORDER BY updated_at DESC
+--   * /topics/top, /topics/{cluster_id}: clusters grouped by (model_name, cluster_id)
+--   * cluster_labels lookups:  (model_name, cluster_id)
+
+-- Same-topic / topics: index scan instead of seq scan + sort.
+-- INCLUDE (uuid) makes it covering for the join back to items.
+CREATE INDEX IF NOT EXISTS idx_clusters_model_cluster_uuid
+    ON clusters(model_name, cluster_id) INCLUDE (uuid);
+
+-- ORDER BY i.updated_at DESC LIMIT k -> top-k index scan
+CREATE INDEX IF NOT EXISTS idx_items_updated_at_desc
+    ON items(updated_at DESC);
+
+-- Label lookups join on (model_name, cluster_id); unique also guards
+-- against duplicate labels from reruns of 03.build_topics_hdbscan.py
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cluster_labels_model_cluster
+    ON cluster_labels(model_name, cluster_id);
+
+-- Equality-only lookups by uuid (= ANY(...) loops); hash is smaller and
+-- faster than btree for pure equality
+CREATE INDEX IF NOT EXISTS idx_items_uuid_hash
+    ON items USING hash (uuid);
+
+-- Verify plans, e.g.:
+--   EXPLAIN (ANALYZE, BUFFERS)
+--   SELECT i.uuid FROM clusters c JOIN items i ON i.uuid = c.uuid
+--   WHERE c.model_name = 'BAAI/bge-m3' AND c.cluster_id = 3
+--   ORDER BY i.updated_at DESC LIMIT 10;
@@ -8,17 +8,46 @@ Handles incremental updates efficiently.
 import os
 import json
 import time
+import threading
 import numpy as np
 import faiss
+import torch
 from typing import List, Dict, Tuple
 from sentence_transformers import SentenceTransformer
 import psycopg2
+from psycopg2.extras import execute_values
 
 # Configuration
 MODEL_NAME = "BAAI/bge-m3"
 MODEL_DIR = "models_semantic"
+
+# Index type for NEW indexes:
+#   "flat16"    brute force over fp16 codes (half the memory/bandwidth of
+#               fp32, recall loss negligible at 1024 dims) — default
+#   "flat"      exact brute force (fp32, 4 bytes/dim per vector)
+#   "opq_ivfpq" OPQ rotation + inverted lists + 8-bit PQ (~10-20x smaller,
+#               much faster queries, minimal recall loss)
+#   "ivf_sq8"   inverted lists + int8 scalar quantizer (4x smaller than
+#               flat, noticeably more accurate than PQ at 100k-1M scale)
+#   "hnsw"      graph index: sub-linear search, incremental add() with no
+#               training step (append-only friendly; no removals)
+# The trained kinds need a reasonable corpus size.
+INDEX_KIND = os.environ.get("FAISS_INDEX_KIND", "flat16")
+
+# Encoder precision on GPU: fp16 engages tensor cores (~2x throughput);
+# set ENCODE_PRECISION=fp32 to opt out
+ENCODE_PRECISION = os.environ.get("ENCODE_PRECISION", "fp16")
+
+# HNSW parameters (only for FAISS_INDEX_KIND=hnsw)
+HNSW_M = int(os.environ.get("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.environ.get("HNSW_EF_CONSTRUCTION", "200"))
+TRAINED_INDEX_MIN = 1000
 INDEX_PATH = os.path.join(MODEL_DIR, "faiss.index")
 UUID_MAP_PATH = os.path.join(MODEL_DIR, "uuid_map.json")
+UUID_MAP_NPY_PATH = os.path.join(MODEL_DIR, "uuid_map.npy")
+UUID_LOG_PATH = os.path.join(MODEL_DIR, "uuid_map.log")
+EMBEDDINGS_PATH = os.path.join(MODEL_DIR, "embeddings.f16")
+HASHES_PATH = os.path.join(MODEL_DIR, "hashes.npy")
 META_PATH = os.path.join(MODEL_DIR, "meta.json")
 
 os.makedirs(MODEL_DIR, exist_ok=True)
@@ -44,8 +73,19 @@ def load_existing_index() -> Tuple[faiss.Index, Dict[int, str], set]:
     print("  📂 Loading existing index...")
     index = faiss.read_index(INDEX_PATH)
     
-    with open(UUID_MAP_PATH, "r") as f:
-        uuid_map = json.load(f)
+    # Prefer the binary map: one np.load instead of tokenizing N JSON strings
+    if os.path.exists(UUID_MAP_NPY_PATH):
+        uuids = np.load(UUID_MAP_NPY_PATH)
+        uuid_map = {str(i): u.decode() for i, u in enumerate(uuids)}
+        # Entries appended since the last compaction live in the log
+        if os.path.exists(UUID_LOG_PATH):
+            with open(UUID_LOG_PATH, "r") as f:
+                for line in f:
+                    idx, _, uuid = line.rstrip("\n").partition("\t")
+                    uuid_map[idx] = uuid
+    else:
+        with open(UUID_MAP_PATH, "r") as f:
+            uuid_map = json.load(f)
     
     indexed_uuids = set(uuid_map.values())
     
@@ -63,41 +103,118 @@ def fetch_items_to_index(conn, indexed_uuids: set) -> List[Dict]:
     Returns:
         List of items to index
     """
-    with conn.cursor() as cur:
-        if indexed_uuids:
+    if indexed_uuids:
+        # Anti-join via temp table: NOT IN over a 100k-value literal
+        # uploads a multi-MB query string and defeats index usage.
+        # The temp table inherits the uuid column type from items.
+        with conn.cursor() as cur:
             cur.execute(
-                """
-                SELECT uuid, title_norm, abstract_norm 
-                FROM items 
-                WHERE uuid NOT IN %s
-                AND abstract_norm IS NOT NULL
-                AND abstract_norm != ''
-                """,
-                (tuple(indexed_uuids),)
+                "CREATE TEMP TABLE _indexed ON COMMIT DROP AS "
+                "SELECT uuid FROM items WHERE false"
             )
-        else:
-            cur.execute(
-                """
-                SELECT uuid, title_norm, abstract_norm 
-                FROM items
-                WHERE abstract_norm IS NOT NULL
-                AND abstract_norm != ''
-                """
+            execute_values(
+                cur,
+                "INSERT INTO _indexed (uuid) VALUES %s",
+                [(u,) for u in indexed_uuids],
+                page_size=1000
             )
-        
-        rows = cur.fetchall()
-    
-    items = [
-        {
-            "uuid": row[0],
-            "title": row[1] or "",
-            "abstract": row[2] or ""
-        }
-        for row in rows
-    ]
+        sql = """
+            SELECT i.uuid, i.title_norm, i.abstract_norm,
+                   md5(coalesce(i.title_norm, '') || coalesce(i.abstract_norm, ''))
+            FROM items i
+            LEFT JOIN _indexed x USING (uuid)
+            WHERE x.uuid IS NULL
+            AND i.abstract_norm IS NOT NULL
+            AND i.abstract_norm != ''
+        """
+    else:
+        sql = """
+            SELECT uuid, title_norm, abstract_norm,
+                   md5(coalesce(title_norm, '') || coalesce(abstract_norm, ''))
+            FROM items
+            WHERE abstract_norm IS NOT NULL
+            AND abstract_norm != ''
+        """
+    
+    # Named (server-side) cursor: rows stream in itersize chunks straight
+    # into the item dicts instead of materializing the full result set in
+    # the libpq buffer first
+    with conn.cursor(name="items_stream") as cur:
+        cur.itersize = 10000
+        cur.execute(sql)
+        items = [
+            {
+                "uuid": row[0],
+                "title": row[1] or "",
+                "abstract": row[2] or "",
+                "content_hash": row[3]
+            }
+            for row in cur
+        ]
     
     return items
 
+def append_embeddings_sidecar(new_vectors: np.ndarray, start_idx: int, dim: int):
+    """
+    Keep embeddings.f16 (raw fp16 matrix, row i = index position i) in sync
+    with the FAISS index so downstream clustering can memory-map it instead
+    of reconstructing vectors one by one.
+    """
+    expected = start_idx * dim * 2
+    size = os.path.getsize(EMBEDDINGS_PATH) if os.path.exists(EMBEDDINGS_PATH) else 0
+    if size != expected:
+        # Out of sync (e.g. index built before the sidecar existed): drop it
+        # rather than append garbage; 03 falls back to reconstruct_n
+        if os.path.exists(EMBEDDINGS_PATH):
+            os.remove(EMBEDDINGS_PATH)
+        if start_idx != 0:
+            print("  ⚠️ embeddings.f16 out of sync with index, sidecar skipped")
+            return
+    with open(EMBEDDINGS_PATH, "ab") as f:
+        f.write(np.ascontiguousarray(new_vectors, dtype=np.float16).tobytes())
+
+def append_hashes_sidecar(hashes: List[str], start_idx: int):
+    """Keep hashes.npy (content md5 per index position) in sync for staleness checks"""
+    arr = np.asarray(hashes, dtype="|S32")
+    if start_idx == 0:
+        np.save(HASHES_PATH, arr)
+        return
+    if not os.path.exists(HASHES_PATH):
+        return  # index predates the sidecar: positions can't be backfilled
+    stored = np.load(HASHES_PATH)
+    if len(stored) != start_idx:
+        os.remove(HASHES_PATH)
+        print("  ⚠️ hashes.npy out of sync with index, sidecar skipped")
+        return
+    np.save(HASHES_PATH, np.concatenate([stored, arr]))
+
+def count_stale_items(conn, uuid_map: Dict[int, str]) -> int:
+    """
+    Count already-indexed items whose content changed since encoding
+    (their stored vector is stale). Uses the hashes.npy sidecar.
+    """
+    if not uuid_map or not os.path.exists(HASHES_PATH):
+        return 0
+    stored = np.load(HASHES_PATH)
+    if len(stored) != len(uuid_map):
+        return 0
+    
+    hash_by_uuid = {uuid_map[str(i)]: stored[i] for i in range(len(stored))}
+    stale = 0
+    with conn.cursor(name="hash_stream") as cur:
+        cur.itersize = 20000
+        cur.execute(
+            """
+            SELECT uuid, md5(coalesce(title_norm, '') || coalesce(abstract_norm, ''))
+            FROM items
+            """
+        )
+        for uuid, content_hash in cur:
+            stored_hash = hash_by_uuid.get(uuid)
+            if stored_hash is not None and stored_hash != content_hash.encode():
+                stale += 1
+    return stale
+
 def build_or_update_index(
     model: SentenceTransformer,
     items: List[Dict],
@@ -125,33 +242,59 @@ def build_or_update_index(
     # Prepare texts (title + abstract)
     texts = [f"{item['title']} {item['abstract']}" for item in items]
     
-    # Encode in batches
+    # Encode in large super-batches into a preallocated buffer: encode()
+    # batches internally (batch_size) and sorts each super-batch by length,
+    # so padding is minimized, while the outer chunking only exists for
+    # progress reporting and to bound encode()'s internal result list
     batch_size = 32
-    embeddings = []
-    
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i + batch_size]
-        batch_embeddings = model.encode(
-            batch,
+    super_batch = 10_000
+    dim = model.get_sentence_embedding_dimension()
+    embeddings = np.empty((len(texts), dim), dtype=np.float32)
+    
+    for i in range(0, len(texts), super_batch):
+        chunk = texts[i:i + super_batch]
+        embeddings[i:i + len(chunk)] = model.encode(
+            chunk,
             normalize_embeddings=True,
+            convert_to_numpy=True,
             show_progress_bar=False,
             batch_size=batch_size
         )
-        embeddings.append(batch_embeddings)
-        
-        if (i // batch_size + 1) % 10 == 0:
-            print(f"    ✓ Processed {i + len(batch)}/{len(texts)} items")
+        print(f"    ✓ Processed {min(i + len(chunk), len(texts))}/{len(texts)} items")
     
-    embeddings = np.vstack(embeddings).astype("float32")
     print(f"  ✅ Embeddings shape: {embeddings.shape}")
     
     # Create or update index
-    dim = embeddings.shape[1]
-    
     if existing_index is None:
         # Create new index
-        print("  🔧 Creating new FAISS index...")
-        index = faiss.IndexFlatIP(dim)  # Inner product (cosine similarity)
+        if INDEX_KIND == "hnsw":
+            # No training needed; matches this script's append-only workflow
+            print(f"  🔧 Creating new FAISS index (HNSW, M={HNSW_M})...")
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        elif INDEX_KIND in ("opq_ivfpq", "ivf_sq8") and len(items) >= TRAINED_INDEX_MIN:
+            nlist = int(4 * np.sqrt(len(items)))
+            if INDEX_KIND == "opq_ivfpq":
+                factory = f"OPQ64,IVF{nlist},PQ64"
+            else:
+                factory = f"IVF{nlist},SQ8"
+            print(f"  🔧 Creating new FAISS index ({factory})...")
+            index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+            print(f"  🎓 Training on {len(items)} vectors...")
+            index.train(embeddings)
+        else:
+            if INDEX_KIND not in ("flat", "flat16"):
+                print(f"  ⚠️ Only {len(items)} items (<{TRAINED_INDEX_MIN}), falling back to flat index")
+            if INDEX_KIND == "flat":
+                print("  🔧 Creating new FAISS index (flat fp32)...")
+                index = faiss.IndexFlatIP(dim)  # Inner product (cosine similarity)
+            else:
+                # fp16 codes: same brute-force search at half the memory
+                # and memory bandwidth (distances still computed in fp32)
+                print("  🔧 Creating new FAISS index (flat fp16)...")
+                index = faiss.IndexScalarQuantizer(
+                    dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+                )
         uuid_map = {}
         start_idx = 0
     else:
@@ -163,6 +306,8 @@ def build_or_update_index(
     
     # Add new vectors
     index.add(embeddings)
+    append_embeddings_sidecar(embeddings, start_idx, dim)
+    append_hashes_sidecar([item["content_hash"] for item in items], start_idx)
     
     # Update UUID mapping
     for i, item in enumerate(items):
@@ -171,14 +316,50 @@ def build_or_update_index(
     print(f"  ✅ Index now contains {index.ntotal} vectors")
     return index, uuid_map
 
+def save_uuid_map(uuid_map: Dict[int, str]):
+    """
+    Persist the uuid map. Incremental runs append only the new entries to
+    uuid_map.log (O(new) writes instead of rewriting the whole map); the
+    base .npy + JSON are rewritten only on fresh builds or when the log
+    outgrows the base (compaction).
+    """
+    total = len(uuid_map)
+    
+    base_len = 0
+    if os.path.exists(UUID_MAP_NPY_PATH):
+        base_len = int(np.load(UUID_MAP_NPY_PATH, mmap_mode="r").shape[0])
+    
+    log_len = 0
+    if os.path.exists(UUID_LOG_PATH):
+        with open(UUID_LOG_PATH, "r") as f:
+            log_len = sum(1 for _ in f)
+    
+    known = base_len + log_len
+    new_entries = total - known
+    if base_len and 0 <= new_entries and log_len + new_entries <= base_len:
+        with open(UUID_LOG_PATH, "a") as f:
+            for i in range(known, total):
+                f.write(f"{i}\t{uuid_map[str(i)]}\n")
+        return
+    
+    # Compaction: the .npy is the primary artifact (the API memory-maps it
+    # directly); the JSON stays for compatibility, unindented — indent=2
+    # alone costs seconds of pure formatting at 1M entries. JSON first:
+    # the API only trusts the .npy when its mtime >= the JSON's
+    ordered = [uuid_map[str(i)] for i in range(total)]
+    with open(UUID_MAP_PATH, "w") as f:
+        json.dump(uuid_map, f)
+    np.save(UUID_MAP_NPY_PATH, np.asarray(ordered, dtype="|S36"))
+    if os.path.exists(UUID_LOG_PATH):
+        os.remove(UUID_LOG_PATH)
+
 def save_index(index: faiss.Index, uuid_map: Dict[int, str]):
     """Save FAISS index and mappings"""
     print("  💾 Saving index...")
     
     faiss.write_index(index, INDEX_PATH)
     
-    with open(UUID_MAP_PATH, "w") as f:
-        json.dump(uuid_map, f, indent=2)
+    save_uuid_map(uuid_map)
     
     # Save metadata
     meta = {
@@ -193,6 +374,7 @@ def save_index(index: faiss.Index, uuid_map: Dict[int, str]):
     
     print(f"  ✅ Saved: {INDEX_PATH}")
     print(f"  ✅ Saved: {UUID_MAP_PATH}")
+    print(f"  ✅ Saved: {UUID_MAP_NPY_PATH}")
     print(f"  ✅ Saved: {META_PATH}")
 
 def main():
@@ -201,25 +383,69 @@ def main():
     print("🧠 SEMANTIC INDEXER - FAISS Index Builder")
     print("=" * 60)
     
+    # CPU threading: many containers default torch to a single thread,
+    # leaving cores idle during the encode hot path. PASSIVE wait keeps
+    # OpenMP workers from spinning while the GIL-side code runs.
+    if not torch.cuda.is_available():
+        n_threads = int(os.environ.get("TORCH_THREADS", str(os.cpu_count() or 8)))
+        os.environ.setdefault("OMP_NUM_THREADS", str(n_threads))
+        os.environ.setdefault("OMP_WAIT_POLICY", "PASSIVE")
+        torch.set_num_threads(n_threads)
+        try:
+            torch.set_num_interop_threads(2)
+        except RuntimeError:
+            pass  # already initialized
+        faiss.omp_set_num_threads(n_threads)
+        print(f"🧵 CPU threads: {n_threads}")
+    
     start_time = time.time()
     
+    # Load existing index
+    print("\n📂 Loading existing index...")
+    existing_index, existing_uuid_map, indexed_uuids = load_existing_index()
+    
+    # Fetch items in the background: the DB round trips hide behind the
+    # (much longer) model initialization below
+    fetch_result = {}
+    
+    def _fetch():
+        try:
+            conn = get_db_connection()
+            try:
+                fetch_result["items"] = fetch_items_to_index(conn, indexed_uuids)
+                fetch_result["stale"] = count_stale_items(conn, existing_uuid_map)
+            finally:
+                conn.close()
+        except Exception as e:
+            fetch_result["error"] = e
+    
+    print("\n🔍 Fetching items to index (background)...")
+    fetch_thread = threading.Thread(target=_fetch)
+    fetch_thread.start()
+    
     # Load model
     print(f"\n📥 Loading model: {MODEL_NAME}")
     model = SentenceTransformer(MODEL_NAME)
+    if torch.cuda.is_available() and ENCODE_PRECISION == "fp16":
+        # bge-m3 is fp16-safe; the fp32 slice assignment in the encode
+        # loop upcasts the outputs, so the index is unaffected
+        model = model.half().to("cuda")
+        print("✅ CUDA: encoder on GPU in fp16")
     print(f"✅ Model loaded (dim: {model.get_sentence_embedding_dimension()})")
     
-    # Load existing index
-    print("\n📂 Loading existing index...")
-    existing_index, existing_uuid_map, indexed_uuids = load_existing_index()
-    
-    # Connect to database and fetch new items
-    print("\n🔍 Fetching items to index...")
-    conn = get_db_connection()
-    items_to_index = fetch_items_to_index(conn, indexed_uuids)
-    conn.close()
+    fetch_thread.join()
+    if "error" in fetch_result:
+        raise fetch_result["error"]
+    items_to_index = fetch_result["items"]
     
     print(f"  ✓ Found {len(items_to_index)} new items to index")
     
+    stale_count = fetch_result.get("stale", 0)
+    if stale_count:
+        # A flat index can't overwrite vectors in place: stale rows need a
+        # full rebuild (delete models_semantic/ artifacts and rerun)
+        print(f"  ⚠️ {stale_count} indexed items changed content since encoding — index is stale, consider a full rebuild")
+    
     if not items_to_index and existing_index is not None:
         print("\n✅ Index is up to date, nothing to do")
         return
@@ -23,8 +23,10 @@ except ImportError:
     HDBSCAN_AVAILABLE = False
 
 import numpy as np
+from collections import Counter, defaultdict
 import faiss
 from typing import Dict, List, Tuple
+from scipy.sparse import csr_matrix
 from sklearn.feature_extraction.text import TfidfVectorizer
 import psycopg2
 from psycopg2.extras import execute_values
@@ -33,6 +35,9 @@ from psycopg2.extras import execute_values
 MODEL_DIR = "models_semantic"
 INDEX_PATH = os.path.join(MODEL_DIR, "faiss.index")
 UUID_MAP_PATH = os.path.join(MODEL_DIR, "uuid_map.json")
+UUID_MAP_NPY_PATH = os.path.join(MODEL_DIR, "uuid_map.npy")
+UUID_LOG_PATH = os.path.join(MODEL_DIR, "uuid_map.log")
+EMBEDDINGS_PATH = os.path.join(MODEL_DIR, "embeddings.f16")
 MODEL_NAME = "BAAI/bge-m3"
 
 # HDBSCAN parameters
@@ -40,6 +45,12 @@ MIN_CLUSTER_SIZE = 5
 MIN_SAMPLES = 3
 CLUSTER_SELECTION_EPSILON = 0.0
 
+# Optional: cluster over a FAISS-precomputed k-NN distance graph instead of
+# the dense matrix. Much faster at scale (FAISS IP search is SIMD-optimized)
+# but the graph can be disconnected on tiny corpora, so it is opt-in.
+KNN_GRAPH = os.environ.get("HDBSCAN_KNN_GRAPH", "0") == "1"
+KNN_K = int(os.environ.get("HDBSCAN_KNN_K", str(max(MIN_SAMPLES * 2, 15))))
+
 def get_db_connection():
     """Get PostgreSQL connection"""
     database_url = os.environ.get("DATABASE_URL")
@@ -47,26 +58,90 @@ def get_db_connection():
         raise ValueError("DATABASE_URL not set")
     return psycopg2.connect(database_url)
 
-def load_index_and_mappings() -> Tuple[np.ndarray, Dict[str, str]]:
+def load_index_and_mappings() -> Tuple[np.ndarray, np.ndarray]:
     """
     Load FAISS index and UUID mappings
     
     Returns:
-        Tuple of (embeddings, uuid_map)
+        Tuple of (embeddings, uuid_by_idx)
     """
     print("  📂 Loading FAISS index...")
     index = faiss.read_index(INDEX_PATH)
     
-    # Extract all vectors
-    embeddings = np.zeros((index.ntotal, index.d), dtype="float32")
-    for i in range(index.ntotal):
-        embeddings[i] = index.reconstruct(i)
-    
-    with open(UUID_MAP_PATH, "r") as f:
-        uuid_map = json.load(f)
+    # Memory-map the raw fp16 matrix written by 02 when it matches the
+    # index; otherwise bulk-reconstruct all vectors in a single C call (no
+    # per-vector Python loop)
+    expected_bytes = index.ntotal * index.d * 2
+    if os.path.exists(EMBEDDINGS_PATH) and os.path.getsize(EMBEDDINGS_PATH) == expected_bytes:
+        embeddings = np.memmap(
+            EMBEDDINGS_PATH, dtype="float16", mode="r",
+            shape=(index.ntotal, index.d)
+        )
+    else:
+        embeddings = np.zeros((index.ntotal, index.d), dtype="float32")
+        index.reconstruct_n(0, index.ntotal, embeddings)
+    
+    # Int-indexed uuid array: uuid_by_idx[i] instead of uuid_map[str(i)],
+    # which cost a string alloc + dict hash per vector in the loops below
+    if os.path.exists(UUID_MAP_NPY_PATH):
+        uuid_by_idx = np.load(UUID_MAP_NPY_PATH)
+        # Entries appended by 02 since the last compaction live in the log
+        if os.path.exists(UUID_LOG_PATH):
+            extras = []
+            with open(UUID_LOG_PATH, "r") as f:
+                for line in f:
+                    idx, _, uuid = line.rstrip("\n").partition("\t")
+                    if int(idx) >= len(uuid_by_idx):
+                        extras.append(uuid)
+            if extras:
+                uuid_by_idx = np.concatenate(
+                    [uuid_by_idx, np.asarray(extras, dtype="|S36")]
+                )
+    else:
+        with open(UUID_MAP_PATH, "r") as f:
+            uuid_map = json.load(f)
+        uuid_by_idx = np.asarray(
+            [uuid_map[str(i)] for i in range(len(uuid_map))], dtype="|S36"
+        )
+        # One-shot migration: next run skips the JSON parse entirely
+        try:
+            np.save(UUID_MAP_NPY_PATH, uuid_by_idx)
+        except OSError:
+            pass
     
     print(f"  ✓ Loaded {len(embeddings)} vectors")
-    return embeddings, uuid_map
+    return embeddings, uuid_by_idx
+
+def build_knn_distance_graph(embeddings: np.ndarray, k: int) -> csr_matrix:
+    """
+    Build a sparse symmetric k-NN cosine-distance graph with FAISS
+    
+    Args:
+        embeddings: L2-normalized document embeddings
+        k: Neighbors per node
+    
+    Returns:
+        Sparse (N, N) distance graph
+    """
+    n, d = embeddings.shape
+    knn_index = faiss.IndexFlatIP(d)
+    knn_index.add(embeddings)
+    D, I = knn_index.search(embeddings, min(k, n))
+    
+    # Inner product on unit vectors -> cosine distance
+    dist = np.maximum(1.0 - D, 0.0)
+    rows = np.repeat(np.arange(n), D.shape[1])
+    graph = csr_matrix((dist.ravel(), (rows, I.ravel())), shape=(n, n))
+    
+    # Symmetrize: HDBSCAN expects an undirected distance graph
+    return graph.maximum(graph.T)
+
+def summarize_labels(labels: np.ndarray) -> Tuple[int, int]:
+    """One C-level pass over labels -> (n_clusters, n_noise)"""
+    uniq, counts = np.unique(labels, return_counts=True)
+    n_noise = int(counts[uniq == -1].sum())
+    n_clusters = int((uniq != -1).sum())
+    return n_clusters, n_noise
 
 def perform_clustering(embeddings: np.ndarray) -> np.ndarray:
     """
@@ -82,31 +157,54 @@ def perform_clustering(embeddings: np.ndarray) -> np.ndarray:
     print(f"     - min_cluster_size: {MIN_CLUSTER_SIZE}")
     print(f"     - min_samples: {MIN_SAMPLES}")
     
+    # The fp16 sidecar halves load memory, but HDBSCAN's trees want fp32
+    if embeddings.dtype != np.float32:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+    
+    # Vectors are L2-normalized by 02, so cosine distance is monotone in
+    # euclidean distance: euclidean gives identical clusters but unlocks
+    # the tree-based boruvka algorithm instead of brute-force pairwise
+    # distances (metric="cosine" forces the O(N^2) generic path)
+    norms = np.linalg.norm(embeddings[: min(len(embeddings), 1000)], axis=1)
+    assert np.allclose(norms, 1.0, atol=1e-2), "embeddings are not L2-normalized"
+    
+    if KNN_GRAPH:
+        print(f"     - precomputed {KNN_K}-NN graph (FAISS)")
+        graph = build_knn_distance_graph(embeddings, KNN_K)
+        clusterer = hdbscan.HDBSCAN(
+            min_cluster_size=MIN_CLUSTER_SIZE,
+            min_samples=MIN_SAMPLES,
+            cluster_selection_epsilon=CLUSTER_SELECTION_EPSILON,
+            metric="precomputed",
+            core_dist_n_jobs=-1
+        )
+        return clusterer.fit_predict(graph)
+    
     clusterer = hdbscan.HDBSCAN(
         min_cluster_size=MIN_CLUSTER_SIZE,
         min_samples=MIN_SAMPLES,
         cluster_selection_epsilon=CLUSTER_SELECTION_EPSILON,
-        metric="cosine",
+        metric="euclidean",
+        algorithm="boruvka_kdtree",
         core_dist_n_jobs=-1
     )
     
     labels = clusterer.fit_predict(embeddings)
     
-    n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
-    n_noise = list(labels).count(-1)
+    n_clusters, n_noise = summarize_labels(labels)
     
     print(f"  ✅ Found {n_clusters} clusters")
     print(f"     - Noise points: {n_noise}")
     
     return labels
 
-def generate_cluster_labels(conn, uuid_map: Dict[str, str], labels: np.ndarray) -> Dict[int, str]:
+def generate_cluster_labels(conn, uuid_by_idx: np.ndarray, labels: np.ndarray) -> Dict[int, str]:
     """
     Generate human-readable labels for clusters using TF-IDF
     
     Args:
         conn: Database connection
-        uuid_map: Mapping from index to UUID
+        uuid_by_idx: Array mapping index position to UUID bytes
         labels: Cluster labels
     
     Returns:
@@ -114,65 +212,96 @@ def generate_cluster_labels(conn, uuid_map: Dict[str, str], labels: np.ndarray)
     """
     print("  🏷️  Generating cluster labels...")
     
-    # Group UUIDs by cluster
-    clusters = {}
-    for idx, label in enumerate(labels):
-        if label == -1:
-            continue
-        
-        uuid = uuid_map[str(idx)]
-        if label not in clusters:
-            clusters[label] = []
-        clusters[label].append(uuid)
-    
-    # Fetch texts for each cluster
-    cluster_labels = {}
-    
-    for cluster_id, uuids in clusters.items():
-        # Fetch titles for this cluster
+    # Map non-noise UUIDs to their cluster: mask + decode happen in C
+    # instead of a Python loop with a branch per vector
+    labels = np.asarray(labels)
+    mask = labels != -1
+    non_noise_uuids = np.char.decode(uuid_by_idx[mask], "ascii").tolist()
+    cluster_by_uuid = dict(zip(non_noise_uuids, labels[mask].tolist()))
+    
+    # One query for every title, grouped locally (one round trip instead
+    # of one per cluster)
+    titles_by_cluster = defaultdict(list)
+    if cluster_by_uuid:
         with conn.cursor() as cur:
             cur.execute(
                 """
-                SELECT title_norm
+                SELECT uuid, title_norm
                 FROM items
                 WHERE uuid = ANY(%s)
                 """,
-                (uuids,)
+                (list(cluster_by_uuid),)
             )
-            texts = [row[0] for row in cur.fetchall() if row[0]]
-        
-        if not texts:
-            cluster_labels[cluster_id] = f"Cluster {cluster_id}"
-            continue
-        
-        # Use TF-IDF to find representative terms
+            for uuid, title in cur.fetchall():
+                if title:
+                    titles_by_cluster[cluster_by_uuid[uuid]].append(title)
+    
+    cluster_labels = {}
+    cluster_ids = sorted(set(cluster_by_uuid.values()))
+    
+    # One global TF-IDF fit: vocabulary, regex tokenization and the sparse
+    # matrix are built once over all titles instead of once per cluster;
+    # each label then comes from summing that cluster's rows
+    all_titles = []
+    row_clusters = []
+    for cluster_id in cluster_ids:
+        for title in titles_by_cluster.get(cluster_id, []):
+            all_titles.append(title)
+            row_clusters.append(cluster_id)
+    
+    X = None
+    feature_names = None
+    if all_titles:
         try:
             vectorizer = TfidfVectorizer(
-                max_features=10,
+                max_features=5000,
                 stop_words=None,
                 ngram_range=(1, 2)
             )
-            vectorizer.fit(texts)
-            
-            # Get top 3 terms
+            X = vectorizer.fit_transform(all_titles)
             feature_names = vectorizer.get_feature_names_out()
-            top_terms = feature_names[:3]
-            label = " + ".join(top_terms)
-            
-            cluster_labels[cluster_id] = label
-        except:
+            row_clusters = np.asarray(row_clusters)
+        except Exception:
+            X = None
+    
+    for cluster_id in cluster_ids:
+        texts = titles_by_cluster.get(cluster_id, [])
+        
+        if not texts:
+            cluster_labels[cluster_id] = f"Cluster {cluster_id}"
+            continue
+        
+        if X is not None:
+            # Top terms of the cluster centroid via argpartition (O(F)
+            # selection, no full sort of the vocabulary)
+            centroid = np.asarray(X[row_clusters == cluster_id].sum(axis=0)).ravel()
+            n_terms = min(3, int((centroid > 0).sum()))
+            if n_terms > 0:
+                top = np.argpartition(-centroid, n_terms - 1)[:n_terms]
+                top = top[np.argsort(-centroid[top])]
+                cluster_labels[cluster_id] = " + ".join(feature_names[i] for i in top)
+                continue
+        
+        # Degenerate cluster (or global fit failed): raw word frequency in
+        # one generator pass instead of a bare numeric label
+        common = Counter(
+            w for t in texts for w in t.split()[:3] if len(w) > 3
+        ).most_common(3)
+        if common:
+            cluster_labels[cluster_id] = " + ".join(w for w, _ in common)
+        else:
             cluster_labels[cluster_id] = f"Cluster {cluster_id}"
     
     print(f"  ✅ Generated {len(cluster_labels)} cluster labels")
     return cluster_labels
 
-def save_clusters_to_db(conn, uuid_map: Dict[str, str], labels: np.ndarray, cluster_labels: Dict[int, str]):
+def save_clusters_to_db(conn, uuid_by_idx: np.ndarray, labels: np.ndarray, cluster_labels: Dict[int, str]):
     """
     Save cluster assignments to database
     
     Args:
         conn: Database connection
-        uuid_map: Mapping from index to UUID
+        uuid_by_idx: Array mapping index position to UUID bytes
         labels: Cluster labels
         cluster_labels: Human-readable cluster labels
     """
@@ -183,14 +312,14 @@ def save_clusters_to_db(conn, uuid_map: Dict[str, str], labels: np.ndarray, clus
         cur.execute("DELETE FROM clusters WHERE model_name = %s", (MODEL_NAME,))
         cur.execute("DELETE FROM cluster_labels WHERE model_name = %s", (MODEL_NAME,))
     
-    # Insert cluster assignments
-    cluster_values = []
-    for idx, label in enumerate(labels):
-        if label == -1:
-            continue
-        
-        uuid = uuid_map[str(idx)]
-        cluster_values.append((uuid, MODEL_NAME, int(label)))
+    # Insert cluster assignments (vectorized mask + decode, as above)
+    labels = np.asarray(labels)
+    mask = labels != -1
+    non_noise_uuids = np.char.decode(uuid_by_idx[mask], "ascii").tolist()
+    cluster_values = [
+        (uuid, MODEL_NAME, label)
+        for uuid, label in zip(non_noise_uuids, labels[mask].tolist())
+    ]
     
     with conn.cursor() as cur:
         execute_values(
@@ -201,7 +330,8 @@ def save_clusters_to_db(conn, uuid_map: Dict[str, str], labels: np.ndarray, clus
             ON CONFLICT (uuid, model_name) DO UPDATE
             SET cluster_id = EXCLUDED.cluster_id
             """,
-            cluster_values
+            cluster_values,
+            page_size=500
         )
     
     # Insert cluster labels
@@ -219,7 +349,8 @@ def save_clusters_to_db(conn, uuid_map: Dict[str, str], labels: np.ndarray, clus
             ON CONFLICT (model_name, cluster_id) DO UPDATE
             SET label = EXCLUDED.label
             """,
-            label_values
+            label_values,
+            page_size=500
         )
     
     conn.commit()
@@ -243,7 +374,7 @@ def main():
     
     # Load index and mappings
     print("\n📂 Loading data...")
-    embeddings, uuid_map = load_index_and_mappings()
+    embeddings, uuid_by_idx = load_index_and_mappings()
     
     # Perform clustering
     print("\n🎯 Clustering...")
@@ -254,19 +385,18 @@ def main():
     
     # Generate cluster labels
     print("\n🏷️  Generating labels...")
-    cluster_labels = generate_cluster_labels(conn, uuid_map, labels)
+    cluster_labels = generate_cluster_labels(conn, uuid_by_idx, labels)
     
     # Save to database
     print("\n💾 Saving to database...")
-    save_clusters_to_db(conn, uuid_map, labels, cluster_labels)
+    save_clusters_to_db(conn, uuid_by_idx, labels, cluster_labels)
     
     conn.close()
     
     elapsed_time = time.time() - start_time
     
     # Print summary
-    n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
-    n_noise = list(labels).count(-1)
+    n_clusters, n_noise = summarize_labels(labels)
     
     print("\n" + "=" * 60)
     print("✅ CLUSTERING COMPLETED")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+04. Convert FAISS Index - Flat -> HNSW / IVF-PQ
+Converts the flat inner-product index built by 02.semantic_indexer.py into
+an approximate index: HNSW (log-N probes, same RAM) or IVF-PQ (compressed
+vectors, ~10x smaller on disk). Run locally, then push the new faiss.index.
+
+Usage:
+    python scripts/04.convert_faiss_index.py hnsw
+    python scripts/04.convert_faiss_index.py ivfpq
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import faiss
+
+# Configuration
+MODEL_DIR = "models_semantic"
+INDEX_PATH = os.path.join(MODEL_DIR, "faiss.index")
+BACKUP_PATH = os.path.join(MODEL_DIR, "faiss.flat.index")
+
+# HNSW parameters
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# IVF-PQ parameters (nlist scales with sqrt(N), capped)
+IVFPQ_NBITS = 8
+
+def extract_vectors(index: faiss.Index) -> np.ndarray:
+    """Reconstruct all vectors from the flat index"""
+    print(f"  📂 Extracting {index.ntotal} vectors (dim {index.d})...")
+    return index.reconstruct_n(0, index.ntotal)
+
+def build_hnsw(vectors: np.ndarray) -> faiss.Index:
+    """Build an HNSW index (inner product, no compression)"""
+    dim = vectors.shape[1]
+    print(f"  🔧 Building IndexHNSWFlat(d={dim}, M={HNSW_M})...")
+
+    index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+    index.add(vectors)
+    return index
+
+def build_ivfpq(vectors: np.ndarray) -> faiss.Index:
+    """Build an IVF-PQ index (compressed, ~10x smaller on disk)"""
+    n, dim = vectors.shape
+    nlist = min(4096, max(16, int(np.sqrt(n)) * 4))
+    # m subquantizers must divide dim
+    m = next(m for m in (64, 48, 32, 16, 8, 4) if dim % m == 0)
+
+    print(f"  🔧 Building IndexIVFPQ(nlist={nlist}, m={m}, nbits={IVFPQ_NBITS})...")
+
+    quantizer = faiss.IndexFlatIP(dim)
+    index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, IVFPQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+    index.train(vectors)
+    index.add(vectors)
+    index.nprobe = 16
+    return index
+
+def main():
+    print("=" * 60)
+    print("🔄 CONVERT FAISS INDEX - Flat -> HNSW / IVF-PQ")
+    print("=" * 60)
+
+    kind = (sys.argv[1] if len(sys.argv) > 1 else "hnsw").lower()
+    if kind not in ("hnsw", "ivfpq"):
+        print(f"❌ Unknown index type: {kind} (use 'hnsw' or 'ivfpq')")
+        sys.exit(1)
+
+    start_time = time.time()
+
+    print(f"\n📂 Loading flat index: {INDEX_PATH}")
+    flat = faiss.read_index(INDEX_PATH)
+    vectors = extract_vectors(flat)
+
+    print(f"\n🔧 Converting to {kind.upper()}...")
+    if kind == "hnsw":
+        index = build_hnsw(vectors)
+    else:
+        index = build_ivfpq(vectors)
+
+    # Keep the flat index around in case of recall regressions
+    print(f"\n💾 Backing up flat index to {BACKUP_PATH}")
+    os.replace(INDEX_PATH, BACKUP_PATH)
+
+    faiss.write_index(index, INDEX_PATH)
+
+    old_size = os.path.getsize(BACKUP_PATH) / (1024 ** 2)
+    new_size = os.path.getsize(INDEX_PATH) / (1024 ** 2)
+    elapsed_time = time.time() - start_time
+
+    print("\n" + "=" * 60)
+    print("✅ CONVERSION COMPLETED")
+    print("=" * 60)
+    print(f"📊 Vectors: {index.ntotal}")
+    print(f"💾 Size: {old_size:.1f} MB -> {new_size:.1f} MB")
+    print(f"⏱️  Time: {elapsed_time:.2f}s")
+
+if __name__ == "__main__":
+    main()
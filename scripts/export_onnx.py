@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Export ONNX - One-off encoder export + int8 quantization
+Produces models_semantic/onnx-int8/model_quantized.onnx ahead of deploy so
+the API (ONNX_INT8=1) loads it directly instead of exporting at boot.
+Requires optimum[onnxruntime].
+"""
+
+import os
+import time
+
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+# Configuration
+MODEL_NAME = os.environ.get("MODEL_NAME", "BAAI/bge-m3")
+MODEL_DIR = os.environ.get("MODEL_DIR", "models_semantic")
+ONNX_DIR = os.path.join(MODEL_DIR, "onnx-int8")
+
+def main():
+    """Export the encoder to ONNX and quantize to dynamic int8"""
+    print("=" * 60)
+    print("📦 EXPORT ONNX - Encoder export + int8 quantization")
+    print("=" * 60)
+
+    start_time = time.time()
+
+    quantized_path = os.path.join(ONNX_DIR, "model_quantized.onnx")
+    if os.path.exists(quantized_path):
+        print(f"\n✅ Already exported: {quantized_path}")
+        return
+
+    print(f"\n📥 Exporting {MODEL_NAME} to ONNX...")
+    model = ORTModelForFeatureExtraction.from_pretrained(MODEL_NAME, export=True)
+    model.save_pretrained(ONNX_DIR)
+    print(f"  ✓ Saved fp32 model to {ONNX_DIR}")
+
+    print("\n🔧 Quantizing to dynamic int8 (AVX-512 VNNI)...")
+    quantizer = ORTQuantizer.from_pretrained(ONNX_DIR)
+    quantizer.quantize(
+        save_dir=ONNX_DIR,
+        quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False),
+    )
+
+    elapsed_time = time.time() - start_time
+
+    print("\n" + "=" * 60)
+    print("✅ EXPORT COMPLETED")
+    print("=" * 60)
+    print(f"💾 Artifact: {quantized_path}")
+    print(f"⏱️  Time: {elapsed_time:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,72 @@ Verifica que todos los archivos necesarios estén listos antes de hacer push
 """
 
 import os
+import re
+import sys
+import mmap
+import argparse
+import fnmatch
 import subprocess
 import json
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# ijson permite leer una sola clave sin parsear todo el JSON (opcional)
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Un solo escaneo por archivo: cada grupo de la alternancia marca qué
+# se encontró (conflicto de merge / reglas LFS / exclusión de PNGs).
+# Patrones en bytes para poder correrlos directo sobre el mmap
+_GITATTRIBUTES_RE = re.compile(rb"(<<<<<<< HEAD)|(\*\.index filter=lfs)|(models_semantic/\*)")
+_GITIGNORE_RE = re.compile(rb"(extension/icons)|(\*\.png)")
+
+def _scan_file(path, regex):
+    """Grupos del regex encontrados en el archivo, escaneado vía mmap
+    (el kernel pagina el archivo; no se copia a un str intermedio)"""
+    with open(path, "rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return [m.lastindex for m in regex.finditer(mm)]
+        except ValueError:
+            # mmap no acepta archivos vacíos
+            return []
+
+MODELS_DIR = "models_semantic"
+
+# Cache de resultados por archivo: {path: [mtime_ns, tamaño, valor]}.
+# Si el archivo no cambió desde la última corrida se reusa el valor
+# sin volver a parsearlo
+CACHE_PATH = ".verify_cache"
+
+def _load_cache():
+    try:
+        with open(CACHE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(cache):
+    try:
+        with open(CACHE_PATH, "w") as f:
+            json.dump(cache, f, separators=(",", ":"))
+    except OSError:
+        pass
+
+def _cached(cache, key, path, compute):
+    """Reusa el valor cacheado si (mtime_ns, tamaño) del path no cambiaron.
+    key es explícita: dos checks distintos pueden leer el mismo archivo"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return compute()
+    entry = cache.get(key)
+    if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+        return entry[2]
+    value = compute()
+    cache[key] = [st.st_mtime_ns, st.st_size, value]
+    return value
 
 # Colores para terminal
 class Colors:
@@ -17,172 +80,360 @@ class Colors:
     BLUE = '\033[94m'
     END = '\033[0m'
 
-def check(condition, message, fix_hint=None):
-    """Verifica una condición y muestra el resultado"""
+# Sin TTY (hook de git, CI, pipe) los códigos ANSI solo ensucian el log
+if not sys.stdout.isatty():
+    Colors.GREEN = Colors.RED = Colors.YELLOW = Colors.BLUE = Colors.END = ''
+
+# Cadenas fijas del reporte, formateadas una sola vez al importar
+# (después del ajuste de colores por TTY)
+RULE = f"{Colors.BLUE}{'='*60}{Colors.END}"
+HEADER = f"{Colors.BLUE}  VERIFICACIÓN PRE-PUSH - HUGGING FACE SPACES{Colors.END}"
+SECTION_FAISS = f"{Colors.BLUE}[1] Archivos FAISS{Colors.END}"
+SECTION_LFS = f"{Colors.BLUE}[2] Git LFS{Colors.END}"
+SECTION_GIT_CONFIG = f"{Colors.BLUE}[3] Configuración Git{Colors.END}"
+SECTION_GIT_STATUS = f"{Colors.BLUE}[4] Estado Git{Colors.END}"
+SECTION_ESSENTIALS = f"{Colors.BLUE}[5] Archivos esenciales para HF Spaces{Colors.END}"
+NEXT_STEP = f"{Colors.BLUE}Siguiente paso:{Colors.END}"
+FOOTER_OK = f"{Colors.GREEN}✓ TODO OK - LISTO PARA PUSH{Colors.END}"
+FOOTER_FAIL = f"{Colors.RED}✗ HAY PROBLEMAS - ARREGLA ANTES DE HACER PUSH{Colors.END}"
+FOOTER_FAIL_FAST = f"{Colors.RED}✗ HAY PROBLEMAS (--fast: no se corrió el resto){Colors.END}"
+
+def check(out, condition, message, fix_hint=None):
+    """Verifica una condición y agrega el resultado al buffer de la sección"""
     if condition:
-        print(f"{Colors.GREEN}✓{Colors.END} {message}")
+        out.append(f"{Colors.GREEN}✓{Colors.END} {message}")
         return True
     else:
-        print(f"{Colors.RED}✗{Colors.END} {message}")
+        out.append(f"{Colors.RED}✗{Colors.END} {message}")
         if fix_hint:
-            print(f"  {Colors.YELLOW}→ {fix_hint}{Colors.END}")
+            out.append(f"  {Colors.YELLOW}→ {fix_hint}{Colors.END}")
         return False
 
-def main():
-    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
-    print(f"{Colors.BLUE}  VERIFICACIÓN PRE-PUSH - HUGGING FACE SPACES{Colors.END}")
-    print(f"{Colors.BLUE}{'='*60}{Colors.END}\n")
-    
-    all_ok = True
-    
-    # 1. Verificar que models_semantic existe
-    print(f"{Colors.BLUE}[1] Archivos FAISS{Colors.END}")
-    models_dir = Path("models_semantic")
-    
-    all_ok &= check(
-        models_dir.exists(),
-        "Carpeta models_semantic/ existe",
-        "Crea la carpeta: mkdir models_semantic"
+def load_lfs_patterns():
+    """Patrones con filter=lfs declarados en .gitattributes"""
+    patterns = []
+    try:
+        with open(".gitattributes", "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and "filter=lfs" in parts[1:]:
+                    patterns.append(parts[0])
+    except OSError:
+        pass
+    return patterns
+
+def _stat(path):
+    """(existe, tamaño en bytes) con una sola llamada a stat"""
+    try:
+        st = os.stat(path)
+        return True, st.st_size
+    except OSError:
+        return False, 0
+
+def _read_meta_count(meta_json):
+    """Lee la clave "count" de meta.json"""
+    if ijson is not None:
+        # Solo interesa "count": parseo incremental y corta ahí
+        with open(meta_json, "rb") as f:
+            return next(ijson.items(f, "count"), 0)
+    with open(meta_json) as f:
+        return json.load(f).get("count", 0)
+
+def _dir_names(path):
+    """Set de nombres dentro de un directorio (vacío si no existe)"""
+    try:
+        with os.scandir(path) as it:
+            return {entry.name for entry in it}
+    except FileNotFoundError:
+        return set()
+
+def check_attr_lfs(paths):
+    """Paths con filter=lfs según git check-attr, o None si git falla.
+    A diferencia de git lfs ls-files no recorre el índice: solo evalúa
+    los atributos de estos paths, y con la semántica real de gitattributes"""
+    try:
+        proc = subprocess.run(
+            ["git", "check-attr", "filter", "--"] + paths,
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+    if proc.returncode != 0:
+        return None
+    tracked = set()
+    for line in proc.stdout.splitlines():
+        # Formato: <path>: filter: <valor>
+        parts = line.split(": ")
+        if len(parts) == 3 and parts[2] == "lfs":
+            tracked.add(parts[0])
+    return tracked
+
+def is_lfs_tracked(path, patterns):
+    """True si el path matchea algún patrón LFS de .gitattributes"""
+    return any(
+        fnmatch.fnmatch(path, pattern)
+        or fnmatch.fnmatch(os.path.basename(path), pattern)
+        for pattern in patterns
+    )
+
+# =====================================================================
+# Secciones: cada una bufferiza sus líneas y devuelve (líneas, ok) para
+# poder correrlas en paralelo e imprimirlas en orden
+# =====================================================================
+
+def section_faiss_files(cache):
+    """[1] Artefactos FAISS en models_semantic/"""
+    out = [SECTION_FAISS]
+    ok = True
+
+    ok &= check(
+        out,
+        _stat(MODELS_DIR)[0],
+        f"Carpeta {MODELS_DIR}/ existe",
+        f"Crea la carpeta: mkdir {MODELS_DIR}"
     )
-    
-    # 2. Verificar archivos individuales
-    faiss_index = models_dir / "faiss.index"
-    uuid_map = models_dir / "uuid_map.json"
-    meta_json = models_dir / "meta.json"
-    
-    all_ok &= check(
-        faiss_index.exists(),
-        f"faiss.index existe ({faiss_index.stat().st_size / (1024**2):.1f} MB)" if faiss_index.exists() else "faiss.index NO existe",
+
+    # Un solo stat por archivo: exists() + stat() duplicaban la syscall
+    faiss_index = os.path.join(MODELS_DIR, "faiss.index")
+    uuid_map = os.path.join(MODELS_DIR, "uuid_map.json")
+    meta_json = os.path.join(MODELS_DIR, "meta.json")
+
+    faiss_exists, faiss_size = _stat(faiss_index)
+    ok &= check(
+        out,
+        faiss_exists,
+        f"faiss.index existe ({faiss_size / (1024**2):.1f} MB)" if faiss_exists else "faiss.index NO existe",
         "Ejecuta scripts/02.semantic_indexer.py"
     )
-    
-    all_ok &= check(
-        uuid_map.exists(),
-        f"uuid_map.json existe ({uuid_map.stat().st_size / 1024:.1f} KB)" if uuid_map.exists() else "uuid_map.json NO existe",
+
+    map_exists, map_size = _stat(uuid_map)
+    ok &= check(
+        out,
+        map_exists,
+        f"uuid_map.json existe ({map_size / 1024:.1f} KB)" if map_exists else "uuid_map.json NO existe",
         "Ejecuta scripts/02.semantic_indexer.py"
     )
-    
-    all_ok &= check(
-        meta_json.exists(),
+
+    meta_exists, _ = _stat(meta_json)
+    ok &= check(
+        out,
+        meta_exists,
         "meta.json existe",
         "Ejecuta scripts/02.semantic_indexer.py"
     )
-    
-    # 3. Verificar contenido de meta.json
-    if meta_json.exists():
+
+    if meta_exists:
         try:
-            with open(meta_json) as f:
-                meta = json.load(f)
-            all_ok &= check(
-                meta.get("count", 0) > 0,
-                f"meta.json tiene {meta.get('count', 0)} vectores indexados",
+            count = _cached(cache, "meta_count", meta_json, lambda: _read_meta_count(meta_json))
+            ok &= check(
+                out,
+                count > 0,
+                f"meta.json tiene {count} vectores indexados",
                 "Verifica que el índice se construyó correctamente"
             )
         except Exception as e:
-            all_ok &= check(False, f"Error leyendo meta.json: {e}")
-    
-    # 4. Verificar Git LFS
-    print(f"\n{Colors.BLUE}[2] Git LFS{Colors.END}")
-    
-    try:
-        result = subprocess.run(
-            ["git", "lfs", "ls-files"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        lfs_files = result.stdout
-        
-        all_ok &= check(
-            "faiss.index" in lfs_files,
+            ok &= check(out, False, f"Error leyendo meta.json: {e}")
+
+    return out, ok
+
+def section_git_lfs(cache):
+    """[2] Tracking LFS de los artefactos pesados"""
+    out = [SECTION_LFS]
+    ok = True
+
+    # git check-attr imprime los paths siempre con "/": normalizar el
+    # separador para que la comparación también funcione en Windows
+    faiss_path = os.path.join(MODELS_DIR, "faiss.index").replace(os.sep, "/")
+    map_path = os.path.join(MODELS_DIR, "uuid_map.json").replace(os.sep, "/")
+
+    # git check-attr evalúa los atributos solo de estos dos paths (no
+    # recorre el índice como git lfs ls-files) y resuelve la semántica
+    # completa de gitattributes; el parseo manual con fnmatch queda de
+    # fallback por si git no está disponible
+    tracked = check_attr_lfs([faiss_path, map_path])
+    if tracked is None:
+        lfs_patterns = _cached(cache, "lfs_patterns", ".gitattributes", load_lfs_patterns)
+        tracked = {p for p in (faiss_path, map_path) if is_lfs_tracked(p, lfs_patterns)}
+
+    if tracked:
+        ok &= check(
+            out,
+            faiss_path in tracked,
             "faiss.index está tracked por Git LFS",
             "Ejecuta: git lfs track 'models_semantic/*.index'"
         )
-        
-        all_ok &= check(
-            "uuid_map.json" in lfs_files,
+
+        ok &= check(
+            out,
+            map_path in tracked,
             "uuid_map.json está tracked por Git LFS",
             "Ejecuta: git lfs track 'models_semantic/*'"
         )
-    except subprocess.CalledProcessError:
-        all_ok &= check(False, "Git LFS no está disponible", "Instala Git LFS: git lfs install")
-    
-    # 5. Verificar .gitattributes
-    print(f"\n{Colors.BLUE}[3] Configuración Git{Colors.END}")
-    
-    gitattributes = Path(".gitattributes")
-    if gitattributes.exists():
-        content = gitattributes.read_text()
-        all_ok &= check(
-            "<<<<<<< HEAD" not in content,
+    else:
+        ok &= check(out, False, "Git LFS no está configurado", "Instala Git LFS: git lfs install")
+
+    return out, ok
+
+def section_git_config(cache):
+    """[3] .gitattributes y .gitignore"""
+    out = [SECTION_GIT_CONFIG]
+    ok = True
+
+    gitattributes = ".gitattributes"
+    if os.path.exists(gitattributes):
+        found = set(_cached(
+            cache, "gitattributes_scan", gitattributes,
+            lambda: _scan_file(gitattributes, _GITATTRIBUTES_RE),
+        ))
+        ok &= check(
+            out,
+            1 not in found,
             ".gitattributes NO tiene conflictos de merge",
             "Resuelve el conflicto en .gitattributes"
         )
-        
-        all_ok &= check(
-            "*.index filter=lfs" in content or "models_semantic/*" in content,
+
+        ok &= check(
+            out,
+            2 in found or 3 in found,
             ".gitattributes configura LFS para índices",
             "Agrega: *.index filter=lfs diff=lfs merge=lfs -text"
         )
     else:
-        all_ok &= check(False, ".gitattributes NO existe", "Ejecuta: git lfs track 'models_semantic/*'")
-    
-    # 6. Verificar .gitignore
-    gitignore = Path(".gitignore")
-    if gitignore.exists():
-        content = gitignore.read_text()
-        all_ok &= check(
-            "extension/icons" in content or "*.png" in content,
+        ok &= check(out, False, ".gitattributes NO existe", "Ejecuta: git lfs track 'models_semantic/*'")
+
+    gitignore = ".gitignore"
+    if os.path.exists(gitignore):
+        ok &= check(
+            out,
+            _cached(cache, "gitignore_png", gitignore,
+                    lambda: bool(_scan_file(gitignore, _GITIGNORE_RE))),
             ".gitignore excluye archivos PNG problemáticos",
             "Agrega a .gitignore: extension/icons/*.png"
         )
-    
-    # 7. Verificar estado de Git
-    print(f"\n{Colors.BLUE}[4] Estado Git{Colors.END}")
-    
-    try:
-        # Archivos sin commit
-        result = subprocess.run(
-            ["git", "status", "--porcelain"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        uncommitted = result.stdout.strip()
-        
-        if uncommitted:
-            print(f"{Colors.YELLOW}⚠{Colors.END} Hay cambios sin commitear:")
-            lines = uncommitted.split('\n')
-            for line in lines[:5]:
-                print(f"    {line}")
+
+    return out, ok
+
+def section_git_status(status_proc):
+    """[4] Cambios sin commitear (subprocess lanzado al inicio de main)"""
+    out = [SECTION_GIT_STATUS]
+    ok = True
+
+    # Solo hace falta el preview de 5 líneas: se corta la lectura ahí y
+    # se termina el proceso en vez de esperar el listado completo
+    lines = []
+    truncated = False
+    with status_proc.stdout:
+        for line in status_proc.stdout:
+            line = line.rstrip("\n")
+            if line:
+                lines.append(line)
             if len(lines) > 5:
-                remaining = len(lines) - 5
-                print(f"    ... y {remaining} más")
-        else:
-            all_ok &= check(True, "No hay cambios sin commitear")
-    except subprocess.CalledProcessError:
-        pass
-    
-    # 8. Verificar archivos esenciales para HF Spaces
-    print(f"\n{Colors.BLUE}[5] Archivos esenciales para HF Spaces{Colors.END}")
-    
-    all_ok &= check(Path("Dockerfile").exists(), "Dockerfile existe")
-    all_ok &= check(Path("requirements.txt").exists(), "requirements.txt existe")
-    all_ok &= check(Path("app/main.py").exists(), "app/main.py existe")
-    all_ok &= check(Path("app/recommender.py").exists(), "app/recommender.py existe")
-    
+                truncated = True
+                break
+    if truncated:
+        status_proc.terminate()
+    returncode = status_proc.wait()
+
+    if lines:
+        out.append(f"{Colors.YELLOW}⚠{Colors.END} Hay cambios sin commitear:")
+        for line in lines[:5]:
+            out.append(f"    {line}")
+        if truncated:
+            out.append(f"    ... y más")
+    elif returncode == 0:
+        ok &= check(out, True, "No hay cambios sin commitear")
+
+    return out, ok
+
+def section_essential_files():
+    """[5] Archivos mínimos que HF Spaces necesita para buildear"""
+    out = [SECTION_ESSENTIALS]
+    ok = True
+
+    # Dos scandir (raíz y app/) en vez de un stat por archivo
+    root_names = _dir_names(".")
+    app_names = _dir_names("app")
+
+    ok &= check(out, "Dockerfile" in root_names, "Dockerfile existe")
+    ok &= check(out, "requirements.txt" in root_names, "requirements.txt existe")
+    ok &= check(out, "main.py" in app_names, "app/main.py existe")
+    ok &= check(out, "recommender.py" in app_names, "app/recommender.py existe")
+
+    return out, ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Verificación pre-push para Hugging Face Spaces")
+    parser.add_argument("--fast", action="store_true",
+                        help="corta en la primera sección con fallas en vez de correr todo")
+    args = parser.parse_args()
+
+    # Todo el reporte se acumula acá y se escribe de una sola vez al
+    # final: un write en vez de un syscall por print
+    report = ["", RULE, HEADER, RULE, ""]
+
+    def _flush_report():
+        sys.stdout.buffer.write(("\n".join(report) + "\n").encode("utf-8"))
+
+    cache = _load_cache()
+
+    # El único subprocess restante (git status) se lanza ya: su arranque
+    # (~100 ms de fork + abrir el repo) se solapa con las otras secciones.
+    # GIT_OPTIONAL_LOCKS=0 evita que toque index.lock en paralelo.
+    # -unormal: no enumera recursivamente dentro de directorios untracked;
+    # --ignore-submodules=all: se salta el status de submódulos
+    status_proc = subprocess.Popen(
+        ["git", "status", "--porcelain", "-unormal", "--ignore-submodules=all"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        env={**os.environ, "GIT_OPTIONAL_LOCKS": "0"},
+    )
+
+    # Las secciones son I/O puro (stats, lecturas chicas, esperar a git):
+    # correrlas en paralelo solapa esas esperas. Cada una bufferiza sus
+    # líneas, así la salida se imprime en el orden de siempre
+    sections = [
+        lambda: section_faiss_files(cache),
+        lambda: section_git_lfs(cache),
+        lambda: section_git_config(cache),
+        lambda: section_git_status(status_proc),
+        section_essential_files,
+    ]
+    # map devuelve en orden de envío, así que --fast puede cortar sin
+    # esperar al resto de las secciones
+    all_ok = True
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        for i, (lines, ok) in enumerate(executor.map(lambda fn: fn(), sections)):
+            if i:
+                report.append("")
+            report.extend(lines)
+            all_ok &= ok
+            if args.fast and not ok:
+                _save_cache(cache)
+                report.append("")
+                report.append(FOOTER_FAIL_FAST)
+                _flush_report()
+                return 1
+
+    _save_cache(cache)
+
     # Resultado final
-    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
+    report.append("")
+    report.append(RULE)
     if all_ok:
-        print(f"{Colors.GREEN}✓ TODO OK - LISTO PARA PUSH{Colors.END}")
-        print(f"\n{Colors.BLUE}Siguiente paso:{Colors.END}")
-        print(f"  git push origin hf")
-    else:
-        print(f"{Colors.RED}✗ HAY PROBLEMAS - ARREGLA ANTES DE HACER PUSH{Colors.END}")
-        return 1
-    print(f"{Colors.BLUE}{'='*60}{Colors.END}\n")
-    
-    return 0
+        report.append(FOOTER_OK)
+        report.append("")
+        report.append(NEXT_STEP)
+        report.append("  git push origin hf")
+        report.append(RULE)
+        report.append("")
+        _flush_report()
+        return 0
+
+    report.append(FOOTER_FAIL)
+    _flush_report()
+    return 1
 
 if __name__ == "__main__":
     exit(main())